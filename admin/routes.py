@@ -1,4 +1,5 @@
 from flask import Blueprint, request, redirect, render_template, session, url_for, current_app
+from auth.throttle import TooManyAttempts, get_login_throttle
 
 bp = Blueprint("admin_auth", __name__)
 
@@ -7,6 +8,12 @@ def admin_login():
     if request.method == "POST":
         email = request.form.get("email")
         password = request.form.get("password")
+        throttle = get_login_throttle()
+        if throttle:
+            try:
+                throttle.check("admin", request.remote_addr, email)
+            except TooManyAttempts as e:
+                return str(e), 429, {"Retry-After": str(e.retry_after)}
         if email == current_app.config["ADMIN_EMAIL"] and password == current_app.config["ADMIN_PASSWORD"]:
             session["admin_logged_in"] = True
             return redirect("/admin/")
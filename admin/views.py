@@ -1,6 +1,7 @@
 from flask_admin.contrib.sqla import ModelView
 from wtforms.fields import BooleanField
-from flask import session, redirect, url_for
+from flask import redirect, url_for
+from auth.admin_session import is_admin
 
 class ProtectedModelView(ModelView):
     column_list = ['email', 'name', 'is_verified', 'is_filled']
@@ -12,7 +13,7 @@ class ProtectedModelView(ModelView):
     can_delete = True  
     can_edit = False    
     def is_accessible(self):
-        return session.get("admin_logged_in", False)
+        return is_admin()
 
     def inaccessible_callback(self, name, **kwargs):
         return redirect(url_for("admin_auth.admin_login"))
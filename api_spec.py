@@ -0,0 +1,142 @@
+"""
+預先產生並快取 OpenAPI 文件。
+
+flasgger 每次有人讀取 /apispec_1.json 都會重新解析所有路由 docstring 的 YAML。
+這裡改成在建置時（flask openapi build）或第一次請求時產生一次，
+之後從記憶體回傳壓縮過的 JSON 並附上 ETag；flask openapi check 在文件與 docstring 不一致時失敗。
+"""
+import difflib
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import click
+from flask import Response, current_app, request
+from flask.cli import with_appcontext
+
+SPEC_ENDPOINT = 'apispec_1'
+
+SWAGGER_TEMPLATE = {
+    "swagger": "2.0",
+    "info": {
+        "title": "Project API",
+        "description": "Flask + Swagger + JWT 認證文件",
+        "version": "1.0"
+    },
+    "securityDefinitions": {
+        "Bearer": {
+            "type": "apiKey",
+            "name": "Authorization",
+            "in": "header",
+            "description": "請輸入 JWT：Bearer <你的 token>"
+        }
+    }
+}
+
+
+def serialize(spec):
+    # 固定 key 順序，同樣的文件一定得到同樣的內容與 ETag
+    return json.dumps(spec, ensure_ascii=False, sort_keys=True, indent=1).encode('utf-8') + b'\n'
+
+
+class CachedSpec:
+    """序列化後的文件，連同 gzip 版本與 ETag"""
+
+    def __init__(self, body):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+
+
+def build_spec(app):
+    """解析所有路由 docstring 產生 OpenAPI 文件"""
+    swagger = app.extensions.get('swagger')
+    if swagger is None:
+        raise RuntimeError('Swagger 未啟用（ENABLE_SWAGGER=false）')
+    with app.test_request_context():
+        return json.loads(json.dumps(swagger.get_apispecs(SPEC_ENDPOINT)))
+
+
+_lock = threading.Lock()
+
+
+def get_cached_spec(app):
+    """優先讀取建置時產生的檔案，沒有時才解析 docstring；結果保存在 app.extensions"""
+    cached = app.extensions.get('openapi_spec')
+    if cached is None:
+        with _lock:
+            cached = app.extensions.get('openapi_spec')
+            if cached is None:
+                path = app.config['OPENAPI_SPEC_PATH']
+                if path and os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        body = f.read()
+                else:
+                    body = serialize(build_spec(app))
+                cached = CachedSpec(body)
+                app.extensions['openapi_spec'] = cached
+    return cached
+
+
+def spec_view():
+    spec = get_cached_spec(current_app._get_current_object())
+    if request.if_none_match.contains(spec.etag):
+        response = Response(status=304)
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = Response(spec.gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(spec.body, mimetype='application/json')
+    response.set_etag(spec.etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # 每次都以 ETag 確認，部署新版後不會拿到舊文件
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def init_api_spec(app):
+    """建立 Swagger 並把 flasgger 的文件路由換成快取版本"""
+    from flasgger import Swagger
+    app.extensions['swagger'] = Swagger(app, template=SWAGGER_TEMPLATE)
+    app.view_functions[f'flasgger.{SPEC_ENDPOINT}'] = spec_view
+
+
+@click.group('openapi')
+def openapi_cli():
+    """產生或檢查預先建置的 OpenAPI 文件"""
+
+
+@openapi_cli.command('build')
+@with_appcontext
+def build_command():
+    """解析 docstring 並寫入 OPENAPI_SPEC_PATH（另存一份 .gz）"""
+    path = current_app.config['OPENAPI_SPEC_PATH']
+    spec = CachedSpec(serialize(build_spec(current_app)))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(spec.body)
+    with open(f'{path}.gz', 'wb') as f:
+        f.write(spec.gzipped)
+    click.echo(f'已寫入 {path}（{len(spec.body)} bytes，gzip {len(spec.gzipped)} bytes，ETag {spec.etag}）')
+
+
+@openapi_cli.command('check')
+@with_appcontext
+def check_command():
+    """OPENAPI_SPEC_PATH 與目前 docstring 產生的文件不一致時以非零狀態結束"""
+    path = current_app.config['OPENAPI_SPEC_PATH']
+    expected = serialize(build_spec(current_app))
+    if not os.path.exists(path):
+        raise click.ClickException(f'找不到 {path}，請先執行 flask openapi build')
+    with open(path, 'rb') as f:
+        actual = f.read()
+    if actual != expected:
+        diff = difflib.unified_diff(
+            actual.decode('utf-8').splitlines(), expected.decode('utf-8').splitlines(),
+            fromfile=path, tofile='docstrings', lineterm='', n=2
+        )
+        click.echo('\n'.join(list(diff)[:200]), err=True)
+        raise click.ClickException('OpenAPI 文件與 docstring 不一致，請執行 flask openapi build')
+    click.echo('OpenAPI 文件與 docstring 一致')
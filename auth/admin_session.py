@@ -0,0 +1,18 @@
+from functools import wraps
+
+from flask import jsonify, session
+
+
+def is_admin():
+    """由 /admin/login 登入後 session 帶有 admin_logged_in，與後台頁面相同的檢查"""
+    return session.get("admin_logged_in", False)
+
+
+def admin_required(view):
+    """只允許已登入後台的管理員，其他請求（包含一般使用者的 JWT）回 403"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({'msg': '需要管理員登入'}), 403
+        return view(*args, **kwargs)
+    return wrapper
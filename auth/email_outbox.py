@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+import random
+import smtplib
+import threading
+import time
+
+from flask import current_app
+from flask_mail import Message
+
+from extensions import db, mail
+from models import EmailOutbox
+
+
+def enqueue_email(recipient, subject, html):
+    """把信件加入目前的交易；與其他資料一起 commit 後才會寄出"""
+    db.session.add(EmailOutbox(recipient=recipient, subject=subject, html=html))
+
+
+def notify_email_sender():
+    # 剛 commit 新信件，叫醒背景寄信程序不必等到下一次輪詢
+    sender = current_app.extensions.get('email_sender')
+    if sender is not None:
+        sender.wake()
+
+
+class EmailSender:
+    """
+    在背景寄出 email_outbox 中待寄的信件。
+    每批最多 batch_size 封，共用同一條 SMTP 連線，閒置超過 idle_timeout 秒才關閉。
+    失敗時依指數退避（加上隨機抖動）排定下次重試，超過 max_attempts 次或收件者被拒則標記為 failed。
+    資料庫支援時以 FOR UPDATE SKIP LOCKED 取信，多個 worker 同時執行也不會重複寄送。
+    """
+
+    # 重試也不會成功的錯誤
+    PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+    def __init__(self, app, batch_size=20, poll_interval=5, max_attempts=5,
+                 backoff_base=30, backoff_max=3600, idle_timeout=60):
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idle_timeout = idle_timeout
+        self._connection = None
+        self._last_used = 0.0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.connections = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="email-sender", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    while not self._stop.is_set() and self.send_pending() == self.batch_size:
+                        pass  # 還有積壓的信件就繼續寄
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️ 寄送驗證信失敗：{e}")
+                finally:
+                    db.session.remove()
+                if time.monotonic() - self._last_used > self.idle_timeout:
+                    self._disconnect()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+        with self.app.app_context():
+            self._disconnect()
+
+    def _connect(self):
+        if self._connection is not None:
+            if self._connection.host is None:
+                return self._connection  # MAIL_SUPPRESS_SEND 時不會真的連線
+            try:
+                self._connection.host.noop()
+                return self._connection
+            except (smtplib.SMTPException, OSError):
+                self._disconnect()
+        connection = mail.connect()
+        connection.__enter__()
+        self._connection = connection
+        self.connections += 1
+        return connection
+
+    def _disconnect(self):
+        if self._connection is None:
+            return
+        try:
+            if self._connection.host is not None:
+                self._connection.host.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._connection = None
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    def send_pending(self):
+        """寄出一批到期的信件，回傳本批處理的封數"""
+        now = datetime.utcnow()
+        emails = EmailOutbox.query \
+            .filter(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now) \
+            .order_by(EmailOutbox.id) \
+            .limit(self.batch_size) \
+            .with_for_update(skip_locked=True) \
+            .all()
+        if not emails:
+            db.session.rollback()
+            return 0
+
+        sender = current_app.config['MAIL_USERNAME']
+        for email in emails:
+            email.attempts += 1
+            try:
+                message = Message(email.subject, sender=sender, recipients=[email.recipient])
+                message.html = email.html
+                self._connect().send(message)
+            except Exception as e:
+                email.last_error = str(e)
+                if isinstance(e, self.PERMANENT_ERRORS) or email.attempts >= self.max_attempts:
+                    email.status = 'failed'
+                    self.failed += 1
+                else:
+                    email.next_attempt_at = datetime.utcnow() + self._backoff(email.attempts)
+                    self.retried += 1
+                # 連線可能已經壞掉，下一封重新連線
+                self._disconnect()
+                continue
+            email.status = 'sent'
+            email.sent_at = datetime.utcnow()
+            email.last_error = None
+            self.sent += 1
+        self._last_used = time.monotonic()
+        db.session.commit()
+        return len(emails)
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "connections": self.connections
+        }
+
+
+def start_email_sender(app):
+    config = app.config
+    sender = EmailSender(
+        app,
+        batch_size=config['EMAIL_BATCH_SIZE'],
+        poll_interval=config['EMAIL_POLL_INTERVAL'],
+        max_attempts=config['EMAIL_MAX_ATTEMPTS'],
+        backoff_base=config['EMAIL_BACKOFF_BASE'],
+        backoff_max=config['EMAIL_BACKOFF_MAX']
+    ).start()
+    app.extensions['email_sender'] = sender
+    return sender
@@ -1,13 +1,22 @@
 from flask import request, jsonify, render_template, current_app
-from flask_mail import Message
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, decode_token
 from itsdangerous import URLSafeTimedSerializer
-from datetime import timedelta
 import re
 
 from . import auth_bp
-from extensions import db, mail
+from extensions import db
 from models import User
+from .email_outbox import enqueue_email, notify_email_sender
+from .tokens import issue_tokens, get_token_blocklist
+from .admin_session import admin_required
+from .throttle import TooManyAttempts, get_login_throttle
+
+@auth_bp.errorhandler(TooManyAttempts)
+def handle_too_many_attempts(e):
+    response = jsonify({'msg': str(e), 'retry_after': e.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -61,18 +70,15 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify({'msg': '此 email 已被註冊'}), 400
 
-    # 建立帳號
+    # 建立帳號，驗證信與帳號在同一個交易寫入 outbox，由背景程序寄出
     user = User(email=email, password=password, name=name)
     db.session.add(user)
-    db.session.commit()
-
-    # 發送驗證信
     s = URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY'])
     token = s.dumps(user.email, salt='email-confirm')
     link = f"http://140.113.26.107:5000/auth/verify/{token}"
-    msg = Message('驗證你的帳號', sender=current_app.config['MAIL_USERNAME'], recipients=[user.email])
-    msg.html = render_template('verify_email.html', link=link, name=name)
-    mail.send(msg)
+    enqueue_email(user.email, '驗證你的帳號', render_template('verify_email.html', link=link, name=name))
+    db.session.commit()
+    notify_email_sender()
 
     return jsonify({'msg': '註冊成功，請到信箱收信完成驗證'}), 201
 
@@ -146,14 +152,113 @@ def login():
           properties:
             token:
               type: string
+              description: 短效 access token，帶有 is_verified、is_filled claims
+            refresh_token:
+              type: string
+              description: 用於 /auth/refresh 換發 access token
       401:
         description: 帳號或密碼錯誤
+      429:
+        description: 同一 IP 或 email 的登入嘗試過於頻繁，依 Retry-After 標頭的秒數後重試
     """
     data = request.json
+    throttle = get_login_throttle()
+    if throttle:
+        throttle.check('login', request.remote_addr, data.get('email'))
     user = User.query.filter_by(email=data['email']).first()
     if not user or not user.check_password(data['password']):
         return jsonify({'msg': '帳號或密碼錯誤'}), 401
+    if user in db.session.dirty:
+        db.session.commit()  # check_password 換了新的雜湊設定
     if not user.is_verified:
         return jsonify({'msg': '請先完成信箱驗證'}), 403
-    token = create_access_token(identity=user.id,expires_delta=timedelta(hours=12))  # 24 hours
-    return jsonify({'token': token})
\ No newline at end of file
+    return jsonify(issue_tokens(user))
+
+@auth_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    """
+    以 refresh token 換發新的 access token 與 refresh token（舊的 refresh token 隨即失效）
+    ---
+    tags:
+      - Auth
+    security:
+      - Bearer: []
+    responses:
+      200:
+        description: 換發成功
+        schema:
+          type: object
+          properties:
+            token:
+              type: string
+            refresh_token:
+              type: string
+      401:
+        description: refresh token 無效、已撤銷或帳號不存在
+    """
+    user = db.session.get(User, int(get_jwt_identity()))
+    if not user or not user.is_verified:
+        return jsonify({'msg': '請重新登入'}), 401
+    get_token_blocklist().revoke(get_jwt())
+    db.session.commit()
+    return jsonify(issue_tokens(user))
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def logout():
+    """
+    撤銷目前的 token；body 帶 refresh_token 時一併撤銷
+    ---
+    tags:
+      - Auth
+    security:
+      - Bearer: []
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: false
+        schema:
+          type: object
+          properties:
+            refresh_token:
+              type: string
+    responses:
+      200:
+        description: 已登出
+    """
+    blocklist = get_token_blocklist()
+    payload = get_jwt()
+    blocklist.revoke(payload)
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh_token:
+        try:
+            refresh_payload = decode_token(refresh_token)
+        except Exception:
+            refresh_payload = None
+        if refresh_payload and refresh_payload['sub'] == payload['sub'] and refresh_payload['jti'] != payload['jti']:
+            blocklist.revoke(refresh_payload)
+    db.session.commit()
+    return jsonify({'msg': '已登出'})
+
+@auth_bp.route('/stats', methods=['GET'])
+@admin_required
+def auth_stats():
+    """
+    登入限流與 token 撤銷的統計 (需要先由 /admin/login 登入後台)
+    ---
+    tags:
+      - Auth
+    responses:
+      200:
+        description: throttle（放行數與依 IP、email 擋下的次數）、blocklist（撤銷數、Bloom filter 大小與誤判數）
+      403:
+        description: 不是已登入的管理員
+    """
+    throttle = get_login_throttle()
+    return jsonify({
+        'throttle': throttle.stats() if throttle else None,
+        'blocklist': get_token_blocklist().stats()
+    })
\ No newline at end of file
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+import math
+import threading
+import time
+
+from flask import current_app
+
+
+class MemoryBucketStore:
+    """單一 process 內的 token bucket，超過 max_keys 時淘汰最久沒用到的 key"""
+
+    def __init__(self, max_keys=100000, **kwargs):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [剩餘 token, 上次更新時間]
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_rate):
+        """取一個 token；成功回傳 0，否則回傳還要等幾秒"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now]
+            else:
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / refill_rate
+
+
+class RedisBucketStore:
+    """存在 Redis 的 token bucket，多個 worker 共用同一份計數；以 Lua script 在 Redis 內原子地更新"""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, redis_url='redis://localhost:6379/0', prefix='throttle:', **kwargs):
+        import redis  # 只有使用 redis backend 時才需要安裝
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(redis_url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, refill_rate):
+        return float(self._script(keys=[self.prefix + key], args=[capacity, refill_rate]))
+
+
+THROTTLE_BACKENDS = {
+    'memory': MemoryBucketStore,
+    'redis': RedisBucketStore,
+}
+
+
+class TooManyAttempts(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f'登入嘗試過於頻繁，請 {self.retry_after} 秒後再試')
+
+
+class LoginThrottle:
+    """
+    在查詢資料庫與比對密碼雜湊之前，依來源 IP 與 email 各自的 token bucket 擋下過多的登入嘗試。
+    每個 key 最多連續嘗試 capacity 次，之後每秒補回 refill_rate 次；被擋下的嘗試計入 shed。
+    """
+
+    def __init__(self, store, ip_capacity=20, ip_refill_rate=0.5, email_capacity=5, email_refill_rate=0.05):
+        self.store = store
+        self.ip_limit = (ip_capacity, ip_refill_rate)
+        self.email_limit = (email_capacity, email_refill_rate)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.shed = {'ip': 0, 'email': 0}
+
+    def check(self, scope, ip, email=None):
+        """超過限制時丟出 TooManyAttempts；scope 區分不同的登入入口（login、admin）"""
+        keys = [('ip', f'{scope}:ip:{ip}', self.ip_limit)]
+        if email:
+            keys.append(('email', f'{scope}:email:{email.strip().lower()}', self.email_limit))
+        for kind, key, (capacity, refill_rate) in keys:
+            wait = self.store.take(key, capacity, refill_rate)
+            if wait:
+                with self._lock:
+                    self.shed[kind] += 1
+                raise TooManyAttempts(wait)
+        with self._lock:
+            self.allowed += 1
+
+    def stats(self):
+        with self._lock:
+            return {"allowed": self.allowed, "shed": dict(self.shed)}
+
+
+def get_login_throttle():
+    """LOGIN_THROTTLE 關閉時回傳 None"""
+    config = current_app.config
+    if not config['LOGIN_THROTTLE']:
+        return None
+    throttle = current_app.extensions.get('login_throttle')
+    if throttle is None:
+        store = THROTTLE_BACKENDS[config['LOGIN_THROTTLE_BACKEND']](
+            redis_url=config['LOGIN_THROTTLE_REDIS_URL'],
+            max_keys=config['LOGIN_THROTTLE_MAX_KEYS']
+        )
+        throttle = LoginThrottle(
+            store,
+            ip_capacity=config['LOGIN_THROTTLE_IP_CAPACITY'],
+            ip_refill_rate=config['LOGIN_THROTTLE_IP_REFILL'],
+            email_capacity=config['LOGIN_THROTTLE_EMAIL_CAPACITY'],
+            email_refill_rate=config['LOGIN_THROTTLE_EMAIL_REFILL']
+        )
+        current_app.extensions['login_throttle'] = throttle
+    return throttle
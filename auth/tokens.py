@@ -0,0 +1,141 @@
+from datetime import datetime
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token
+
+from extensions import db, jwt
+from models import RevokedToken
+
+
+def issue_access_token(identity, is_verified, is_filled):
+    """access token 帶著常用的使用者旗標，端點直接讀 claims 不必查 users"""
+    return create_access_token(
+        identity=str(identity),
+        additional_claims={'is_verified': bool(is_verified), 'is_filled': bool(is_filled)}
+    )
+
+
+def issue_tokens(user):
+    return {
+        'token': issue_access_token(user.id, user.is_verified, user.is_filled),
+        'refresh_token': create_refresh_token(identity=str(user.id))
+    }
+
+
+class BloomFilter:
+    """固定大小的 Bloom filter；不在集合中的 key 一定回傳 False，在集合中的偶爾誤判為 True"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class TokenBlocklist:
+    """
+    已撤銷 token 的記憶體索引。撤銷紀錄存在 revoked_tokens，這裡只保留尚未過期的 jti 組成的 Bloom filter，
+    每 refresh_interval 秒重建一次（順便刪除已過期的紀錄），其他 worker 撤銷的 token 最晚在下次重建時生效。
+    絕大多數請求的 token 不在 filter 中，不查資料庫；命中時才查 revoked_tokens 確認，排除誤判。
+    """
+
+    def __init__(self, refresh_interval=30, capacity=100000, error_rate=0.001):
+        self.refresh_interval = refresh_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = None
+        self._loaded_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self.checked = 0
+        self.confirmed = 0
+        self.false_positives = 0
+
+    def refresh(self):
+        now = datetime.utcnow()
+        RevokedToken.query.filter(RevokedToken.expires_at <= now).delete()
+        db.session.commit()
+        jtis = [jti for (jti,) in db.session.query(RevokedToken.jti)]
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        self._filter = bloom
+        self._loaded_at = time.monotonic()
+
+    def _current(self):
+        stale = time.monotonic() - self._loaded_at > self.refresh_interval
+        # 已有 filter 時由一個請求重建，其他請求繼續使用舊的
+        if stale and self._refresh_lock.acquire(blocking=self._filter is None):
+            try:
+                if self._filter is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+                    self.refresh()
+            finally:
+                self._refresh_lock.release()
+        return self._filter
+
+    def is_revoked(self, jti):
+        self.checked += 1
+        if jti not in self._current():
+            return False
+        if db.session.query(RevokedToken.id).filter_by(jti=jti).first() is not None:
+            self.confirmed += 1
+            return True
+        self.false_positives += 1
+        return False
+
+    def revoke(self, payload):
+        """加入目前的交易，由呼叫端 commit"""
+        bloom = self._current()
+        db.session.add(RevokedToken(
+            jti=payload['jti'],
+            token_type=payload['type'],
+            user_id=int(payload['sub']),
+            expires_at=datetime.utcfromtimestamp(payload['exp'])
+        ))
+        bloom.add(payload['jti'])
+
+    def stats(self):
+        bloom = self._filter
+        return {
+            "revoked": bloom.count if bloom else 0,
+            "filter_bytes": len(bloom.bits) if bloom else 0,
+            "checked": self.checked,
+            "confirmed": self.confirmed,
+            "false_positives": self.false_positives
+        }
+
+
+def get_token_blocklist():
+    blocklist = current_app.extensions.get('token_blocklist')
+    if blocklist is None:
+        config = current_app.config
+        blocklist = TokenBlocklist(
+            refresh_interval=config['TOKEN_BLOCKLIST_REFRESH_INTERVAL'],
+            capacity=config['TOKEN_BLOCKLIST_CAPACITY'],
+            error_rate=config['TOKEN_BLOCKLIST_ERROR_RATE']
+        )
+        current_app.extensions['token_blocklist'] = blocklist
+    return blocklist
+
+
+@jwt.token_in_blocklist_loader
+def _is_token_revoked(jwt_header, jwt_payload):
+    return get_token_blocklist().is_revoked(jwt_payload['jti'])
@@ -0,0 +1,137 @@
+"""
+本機假 Ollama 伺服器，實作 /api/generate 與 /api/tags，用來檢查每一輪的 prefill 工作量。
+
+每個字元視為一個 token。請求帶入的 context 若是伺服器先前回傳過的（等同 KV cache 命中），
+只計算新 prompt 的 prefill；否則 context 與 prompt 都要重新計算。
+
+    python -m benchmarks.fake_ollama --port 11435
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+import argparse
+import itertools
+import json
+import threading
+import time
+
+
+QUESTIONS = [
+    ("你比較喜歡一個人還是和朋友一起活動？", "一個人", "和朋友"),
+    ("週末你通常想出門還是待在家？", "出門", "待在家"),
+    ("你偏好動態還是靜態的休閒？", "動態", "靜態"),
+    ("空閒時你會想學新技能嗎？", "會", "不會"),
+    ("你喜歡大自然的風景嗎？", "喜歡", "普通"),
+    ("音樂對你放鬆有幫助嗎？", "有", "沒有"),
+    ("你願意花錢在興趣上嗎？", "願意", "盡量省"),
+    ("壓力大時你想流汗發洩嗎？", "想", "不想"),
+    ("你對烹飪有興趣嗎？", "有興趣", "沒興趣"),
+    ("你習慣早起還是晚睡？", "早起", "晚睡"),
+    ("手作或創作會讓你開心嗎？", "會", "不會"),
+    ("你喜歡嘗試刺激冒險的活動嗎？", "喜歡", "不喜歡"),
+]
+
+
+class FakeOllama:
+    def __init__(self, host="127.0.0.1", port=0, latency_per_token=0.0, cache_size=256):
+        self.latency_per_token = latency_per_token
+        self.cache_size = cache_size
+        self.cached_contexts = OrderedDict()
+        self.requests = []  # 每次請求的 {"prompt_tokens", "prefill", "context_hit", "prompt", "response"}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, prompt):
+        if not prompt:
+            return ""  # 與 Ollama 相同，空的 prompt 只載入模型
+        n = next(self._counter)
+        if "推薦一個最適合" in prompt:
+            return "推薦活動：閱讀。你偏好安靜的室內活動。"
+        title, first, second = QUESTIONS[(n - 1) % len(QUESTIONS)]
+        return f"問題：{title}\n選項一：{first}\n選項二：{second}"
+
+    def generate(self, body):
+        prompt_tokens = [ord(c) for c in body.get("prompt", "")]
+        context = body.get("context") or []
+        with self._lock:
+            hit = tuple(context) in self.cached_contexts
+        prefill = len(prompt_tokens) + (0 if hit or not context else len(context))
+        time.sleep(prefill * self.latency_per_token)
+
+        text = self.respond(body.get("prompt", ""))
+        new_context = context + prompt_tokens + [ord(c) for c in text]
+        with self._lock:
+            self.requests.append({"prompt_tokens": len(prompt_tokens), "prefill": prefill, "context_hit": hit,
+                                  "prompt": body.get("prompt", ""), "response": text})
+            self.cached_contexts[tuple(new_context)] = True
+            while len(self.cached_contexts) > self.cache_size:
+                self.cached_contexts.popitem(last=False)
+        return text, new_context, prefill
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, data):
+                payload = json.dumps(data, ensure_ascii=False).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    return self._send_json({"models": [{"name": "yi:latest"}]})
+                self.send_error(404)
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    return self.send_error(404)
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+                text, context, prefill = fake.generate(body)
+                done = {"done": True, "context": context, "prompt_eval_count": prefill, "response": ""}
+                if not body.get("stream", True):
+                    return self._send_json(dict(done, response=text))
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for char in text:
+                    self.wfile.write(json.dumps({"response": char, "done": False}, ensure_ascii=False).encode() + b"\n")
+                self.wfile.write(json.dumps(done).encode() + b"\n")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency-per-token", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeOllama(args.host, args.port, args.latency_per_token)
+    print(f"fake ollama listening on {fake.base_url}")
+    fake.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
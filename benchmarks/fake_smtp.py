@@ -0,0 +1,100 @@
+"""
+本機假 SMTP 伺服器，收下的信件保存在記憶體中，並記錄開過幾條連線，用來檢查寄信程序是否重用連線。
+fail_next 設為 n 時，接下來 n 封信會以 451 暫時失敗回應，用來檢查重試。
+
+    python -m benchmarks.fake_smtp --port 1025
+    MAIL_SERVER=127.0.0.1 MAIL_PORT=1025 MAIL_USE_TLS=false flask run
+"""
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+import argparse
+import threading
+
+
+class FakeSMTP:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.messages = []  # {"sender", "recipients", "data"}
+        self.connections = 0
+        self.fail_next = 0
+        self._lock = threading.Lock()
+        ThreadingTCPServer.allow_reuse_address = True
+        self.server = ThreadingTCPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                with fake._lock:
+                    fake.connections += 1
+                self.reply("220 fake-smtp ready")
+                sender, recipients = None, []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors="replace").strip()
+                    verb = command[:4].upper()
+                    if verb in ("EHLO", "HELO"):
+                        self.reply("250 fake-smtp")
+                    elif verb == "MAIL":
+                        sender, recipients = command[10:].strip(), []
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        recipients.append(command[8:].strip())
+                        self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        data = b""
+                        while True:
+                            chunk = self.rfile.readline()
+                            if not chunk or chunk == b".\r\n":
+                                break
+                            data += chunk
+                        with fake._lock:
+                            failing = fake.fail_next > 0
+                            if failing:
+                                fake.fail_next -= 1
+                            else:
+                                fake.messages.append({"sender": sender, "recipients": recipients, "data": data})
+                        self.reply("451 Try again later" if failing else "250 OK")
+                    elif verb in ("RSET", "NOOP"):
+                        self.reply("250 OK")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    fake = FakeSMTP(args.host, args.port)
+    print(f"fake smtp listening on {args.host}:{args.port}")
+    fake.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+登入尖峰的吞吐量：多個執行緒同時呼叫 POST /auth/login，
+同時量測另一個輕量請求（GET /healthz）的延遲，看雜湊計算是否拖慢其他請求。
+比較在請求執行緒計算雜湊（workers=0）與交給 process pool。
+
+    python -m benchmarks.login_throughput --threads 8 --seconds 5
+    python -m benchmarks.login_throughput --method pbkdf2:sha256:600000
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.update(OLLAMA_WARMUP="false", EMAIL_SENDER="false", ENABLE_SWAGGER="false", ENABLE_ADMIN="false",
+                  LOGIN_THROTTLE="false")  # 全部來自同一個 IP，不要被限流擋下
+
+from extensions import db  # noqa: E402
+from main import create_app  # noqa: E402
+from models import User  # noqa: E402
+
+PASSWORD = "Abc123@!"
+
+
+def run(workers, method, threads, seconds, users):
+    app = create_app()
+    app.config.update(PASSWORD_HASH_WORKERS=workers, PASSWORD_HASH_METHOD=method)
+    with app.app_context():
+        User.__table__.drop(db.engine, checkfirst=True)
+        User.__table__.create(db.engine)
+        for i in range(users):
+            db.session.add(User(email=f"bench{i}@example.com", password=PASSWORD, name="bench", is_verified=True))
+        db.session.commit()
+
+    logins = [0] * threads
+    probe_latencies = []
+    stop = threading.Event()
+
+    def login(n):
+        client = app.test_client()
+        i = n
+        while not stop.is_set():
+            response = client.post("/auth/login", json={"email": f"bench{i % users}@example.com", "password": PASSWORD})
+            assert response.status_code == 200, response.data
+            logins[n] += 1
+            i += threads
+
+    def probe():
+        client = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get("/healthz")
+            probe_latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.05)
+
+    workers_threads = [threading.Thread(target=login, args=(n,)) for n in range(threads)]
+    workers_threads.append(threading.Thread(target=probe))
+    for thread in workers_threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in workers_threads:
+        thread.join()
+
+    with app.app_context():
+        hasher = app.extensions["password_hasher"]
+        hasher.shutdown()
+    rate = sum(logins) / seconds
+    cores = hasher.max_workers or 1
+    return rate, rate / cores, statistics.median(probe_latencies), max(probe_latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--method", default="scrypt")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    print(f"method={args.method} threads={args.threads} cpus={multiprocessing.cpu_count()}")
+    print(f"{'hashing':>14} | {'logins/s':>8} | {'per core':>8} | {'healthz p50':>11} | {'healthz max':>11}")
+    for label, workers in (("request thread", 0), (f"pool x{args.workers}", args.workers)):
+        rate, per_core, p50, worst = run(workers, args.method, args.threads, args.seconds, args.users)
+        print(f"{label:>14} | {rate:>8.1f} | {per_core:>8.1f} | {p50:>9.1f}ms | {worst:>9.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
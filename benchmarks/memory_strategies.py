@@ -0,0 +1,73 @@
+"""
+比較各種對話記憶策略每一輪的 prompt 大小與延遲。
+
+    python -m benchmarks.memory_strategies --turns 20
+    python -m benchmarks.memory_strategies --turns 20 --ollama yi   # 實際呼叫 Ollama 量測延遲
+
+未指定 --ollama 時只量測組 prompt 的時間，題目與摘要由固定內容代替。
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_memory import MEMORY_STRATEGIES, create_memory, estimate_tokens  # noqa: E402
+from ollama_agent import OllamaMultiTurnAgent  # noqa: E402
+
+
+def fake_question(turn):
+    return f"問題：第 {turn} 題，你比較喜歡哪一種休閒方式？\n選項一：安靜的室內活動\n選項二：熱鬧的戶外活動"
+
+
+def fake_summarizer(summary, chat_history):
+    return (summary + " " + chat_history.replace("\n", " "))[:150]
+
+
+def run(strategy, turns, token_budget, agent=None):
+    memory = create_memory(strategy, token_budget, summarizer=fake_summarizer)
+    if agent is not None:
+        memory.summarizer = agent._summarize_history
+        agent.memory = memory  # _follow_up_request 以 agent.memory 組 prompt
+    rows = []
+    for turn in range(1, turns + 1):
+        memory.refresh("benchmark")
+        memory.add_ai_message(fake_question(turn))
+        memory.add_user_message("安靜的室內活動" if turn % 2 else "熱鬧的戶外活動")
+        memory.maintain("benchmark")
+
+        start = time.perf_counter()
+        chat_history = memory.render()
+        if agent is not None:
+            prompt, context = agent._follow_up_request(memory.messages, memory.messages[-1].content, [])
+            agent.backend.invoke(prompt, context)
+        elapsed = time.perf_counter() - start
+        rows.append((turn, estimate_tokens(chat_history), elapsed))
+    memory.release("benchmark")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=300, help="對話記憶的 token 預算")
+    parser.add_argument("--ollama", metavar="MODEL", help="實際呼叫這個 Ollama 模型量測延遲")
+    args = parser.parse_args()
+
+    agent = OllamaMultiTurnAgent(model_name=args.ollama) if args.ollama else None
+    results = {strategy: run(strategy, args.turns, args.tokens, agent) for strategy in MEMORY_STRATEGIES}
+
+    header = "turn" + "".join(f" | {strategy:>10} tok {'ms':>8}" for strategy in results)
+    print(header)
+    print("-" * len(header))
+    for i in range(args.turns):
+        line = f"{i + 1:>4}"
+        for rows in results.values():
+            _, tokens, elapsed = rows[i]
+            line += f" | {tokens:>14} {elapsed * 1000:>8.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
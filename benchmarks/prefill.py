@@ -0,0 +1,88 @@
+"""
+在假 Ollama 伺服器上跑完整問卷，比較沿用 context 與每輪重送完整 prompt 的 prefill token 數，
+並檢查沿用 context 時第一次呼叫之後的每一輪：帶入的 context 都命中、prefill 只有這一輪的 prompt，
+且 prompt 不再包含 context 已涵蓋的題目。不符合時列出問題並以非零狀態結束，可放進 CI。
+
+    python -m benchmarks.prefill --turns 10
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+from llm_backend import OllamaHTTPBackend  # noqa: E402
+from ollama_agent import OllamaMultiTurnAgent  # noqa: E402
+
+
+class NoContextBackend(OllamaHTTPBackend):
+    supports_context = False
+
+
+def run(backend_cls, turns, num_ctx):
+    """回傳 (每次請求的紀錄, 固定題目)"""
+    fake = FakeOllama().start()
+    try:
+        backend = backend_cls(base_url=fake.base_url, num_ctx=num_ctx)
+        agent = OllamaMultiTurnAgent(backend=backend)
+        question = agent.get_next_question()
+        for _ in range(turns):
+            option = agent.get_question_options(question)[0]
+            question = agent.get_next_question(user_answer=option)
+        agent.summarize_recommendation()
+        return fake.requests, list(agent.initial_questions)
+    finally:
+        fake.stop()
+
+
+def check(full, reused, initial_questions):
+    """回傳不符合預期的描述，空 list 表示通過"""
+    problems = []
+    if len(full) < 2 or not all(q in full[1]["prompt"] for q in initial_questions):
+        # 確認題目在 prompt 中的寫法與比對方式一致，否則下面的檢查不會抓到任何東西
+        problems.append("重送完整 prompt 時第二次呼叫應包含固定題目，無法檢查")
+    if not reused or reused[0]["context_hit"]:
+        problems.append("第一次呼叫沒有可沿用的 context，應送出完整 prompt")
+
+    covered = list(initial_questions)  # context 已涵蓋的題目
+    for i, request in enumerate(reused, 1):
+        if i > 1:
+            if not request["context_hit"]:
+                problems.append(f"第 {i} 次呼叫沒有沿用上一輪的 context")
+            if request["prefill"] != request["prompt_tokens"]:
+                problems.append(f"第 {i} 次呼叫 prefill {request['prefill']}，超過 prompt 的 {request['prompt_tokens']}")
+            resent = [q.splitlines()[0] for q in covered if q in request["prompt"]]
+            if resent:
+                problems.append(f"第 {i} 次呼叫重送了 context 已涵蓋的題目：{resent}")
+        covered.append(request["response"])
+
+    if sum(r["prefill"] for r in reused) >= sum(r["prefill"] for r in full):
+        problems.append("沿用 context 的 prefill 總量沒有比重送完整 prompt 少")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--num-ctx", type=int, default=8192)
+    args = parser.parse_args()
+
+    full, initial_questions = run(NoContextBackend, args.turns, args.num_ctx)
+    reused, _ = run(OllamaHTTPBackend, args.turns, args.num_ctx)
+
+    print(f"{'call':>4} | {'full prompt':>11} | {'reuse context':>13}")
+    for i, (a, b) in enumerate(zip(full, reused), 1):
+        print(f"{i:>4} | {a['prefill']:>11} | {b['prefill']:>13}")
+    print(f"{'sum':>4} | {sum(r['prefill'] for r in full):>11} | {sum(r['prefill'] for r in reused):>13}")
+
+    problems = check(full, reused, initial_questions)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✅ 第一次呼叫之後每一輪只 prefill 新增的內容，並沿用上一輪的 context")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+量測每位使用者的問卷成本：建立 agent 並回傳第一題（/start）的時間，以及保存在 session store 中的狀態大小。
+
+比較共用 LLM client 與題目模板和每位使用者各自建立，以及 QuestionnaireState 與等價 dict 的記憶體用量。
+
+    python -m benchmarks.session_footprint --sessions 1000 --turns 6
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.prompts import PromptTemplate  # noqa: E402
+from llm_backend import OllamaHTTPBackend  # noqa: E402
+from ollama_agent import OllamaMultiTurnAgent  # noqa: E402
+
+SHARED_BACKEND = OllamaHTTPBackend()
+
+
+PROMPTS = ("follow_up_prompt", "follow_up_continue_prompt", "summary_prompt",
+           "summary_continue_prompt", "history_summary_prompt")
+
+
+def start_latency(iterations, make_backend, rebuild_prompts=False):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        agent = OllamaMultiTurnAgent(backend=make_backend())
+        if rebuild_prompts:
+            # 模擬每位使用者各自建立模板的舊做法
+            for name in PROMPTS:
+                prompt = getattr(agent, name)
+                setattr(agent, name, PromptTemplate(input_variables=prompt.input_variables, template=prompt.template))
+        agent.get_next_question()
+        agent.to_state()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def sample_state(turns, context_tokens, user):
+    agent = OllamaMultiTurnAgent(backend=SHARED_BACKEND)
+    for turn in range(turns):
+        question = f"問題：第 {turn} 題，使用者 {user} 比較喜歡哪一種？\n選項一：室內\n選項二：戶外"
+        agent.memory.add_ai_message(question)
+        agent.memory.add_user_message("室內")
+        agent._accept_question(question)
+    agent.llm_context = [(user * 7 + i) % 64000 + 1000 for i in range(context_tokens)]
+    agent.context_messages = len(agent.memory.messages)
+    return agent.to_state()
+
+
+def stored_size(sessions, turns, context_tokens, as_dict):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    store = {}
+    for user in range(sessions):
+        state = sample_state(turns, context_tokens, user)
+        store[user] = state.to_dict() if as_dict else state
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return total / sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--context-tokens", type=int, default=1500)
+    args = parser.parse_args()
+
+    shared = start_latency(args.sessions, lambda: SHARED_BACKEND)
+    fresh = start_latency(args.sessions, OllamaHTTPBackend, rebuild_prompts=True)
+    print(f"/start   shared client and prompts: {shared:.3f} ms   per session: {fresh:.3f} ms")
+
+    record = stored_size(args.sessions, args.turns, args.context_tokens, as_dict=False)
+    plain = stored_size(args.sessions, args.turns, args.context_tokens, as_dict=True)
+    print(f"session  QuestionnaireState: {record / 1024:.1f} KiB   dict: {plain / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
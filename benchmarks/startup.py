@@ -0,0 +1,81 @@
+"""
+量測 worker 啟動成本：匯入 main、create_app 與第一個請求（POST /questionnaire/start）的時間。
+每次都在新的 Python process 中量測，取多次的中位數；--json 輸出一行 JSON，方便跨版本追蹤。
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 5 --json >> startup.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+app = main.create_app()
+t2 = time.perf_counter()
+from flask_jwt_extended import create_access_token
+with app.app_context():
+    token = create_access_token(identity="1")
+response = app.test_client().post("/questionnaire/start", headers={"Authorization": "Bearer " + token})
+t3 = time.perf_counter()
+assert response.status_code == 200, response.data
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "modules": len(sys.modules)
+}))
+"""
+
+VARIANTS = {
+    "default": {},
+    "lean": {"ENABLE_SWAGGER": "false", "ENABLE_ADMIN": "false"},
+    # HTTP 後端完全不需要 langchain
+    "lean-http": {"ENABLE_SWAGGER": "false", "ENABLE_ADMIN": "false", "OLLAMA_BACKEND": "http"},
+}
+
+
+def measure(env_overrides):
+    env = dict(
+        os.environ,
+        DATABASE_URL="sqlite://",
+        OLLAMA_WARMUP="false",
+        QUESTIONNAIRE_TRANSCRIPTS="false",
+        **env_overrides
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    for name, overrides in VARIANTS.items():
+        samples = [measure(overrides) for _ in range(args.runs)]
+        results[name] = {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{'variant':>9} | {'import':>8} | {'create_app':>10} | {'first request':>13} | {'modules':>7}")
+    for name, r in results.items():
+        print(f"{name:>9} | {r['import_ms']:>6.0f}ms | {r['create_app_ms']:>8.0f}ms | "
+              f"{r['first_request_ms']:>11.0f}ms | {r['modules']:>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
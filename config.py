@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -7,12 +8,115 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev-secret')  # 預設值供本地測試
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret')
+
+    # access token 短效並帶 is_verified、is_filled claims；過期後以 refresh token 換發，不必重新登入
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', 15)))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_DAYS', 30)))
+    # 已撤銷 token 的 Bloom filter 每 REFRESH_INTERVAL 秒依資料庫重建，命中時才查資料庫確認
+    TOKEN_BLOCKLIST_REFRESH_INTERVAL = float(os.getenv('TOKEN_BLOCKLIST_REFRESH_INTERVAL', 30))  # 秒
+    TOKEN_BLOCKLIST_CAPACITY = int(os.getenv('TOKEN_BLOCKLIST_CAPACITY', 100000))
+    TOKEN_BLOCKLIST_ERROR_RATE = float(os.getenv('TOKEN_BLOCKLIST_ERROR_RATE', 0.001))
     
-    MAIL_SERVER = 'smtp.gmail.com'
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+    MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
 
+    # 驗證信先寫入 email_outbox，再由背景程序共用同一條 SMTP 連線批次寄出；失敗時依指數退避重試
+    EMAIL_SENDER = os.getenv('EMAIL_SENDER', 'true').lower() == 'true'
+    EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', 20))
+    EMAIL_POLL_INTERVAL = float(os.getenv('EMAIL_POLL_INTERVAL', 5))  # 秒
+    EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', 5))
+    EMAIL_BACKOFF_BASE = float(os.getenv('EMAIL_BACKOFF_BASE', 30))  # 秒，第 n 次失敗後等待 BASE * 2^(n-1)
+    EMAIL_BACKOFF_MAX = float(os.getenv('EMAIL_BACKOFF_MAX', 3600))
+
+    # 密碼雜湊在獨立的 process pool 計算；METHOD 變更後，舊雜湊會在使用者下次登入成功時換成新設定
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')  # 例如 scrypt:32768:8:1、pbkdf2:sha256:600000
+    PASSWORD_HASH_SALT_LENGTH = int(os.getenv('PASSWORD_HASH_SALT_LENGTH', 16))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS')) if os.getenv('PASSWORD_HASH_WORKERS') else None  # 預設為 CPU 數，0 則不使用 pool
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING')) if os.getenv('PASSWORD_HASH_MAX_PENDING') else None
+
+    # 登入前依 IP 與 email 各自的 token bucket 限制嘗試次數：最多連續 CAPACITY 次，之後每秒補回 REFILL 次
+    # BACKEND 為 memory（單一 process）或 redis（多個 worker 共用，需安裝 redis）
+    LOGIN_THROTTLE = os.getenv('LOGIN_THROTTLE', 'true').lower() == 'true'
+    LOGIN_THROTTLE_BACKEND = os.getenv('LOGIN_THROTTLE_BACKEND', 'memory')
+    LOGIN_THROTTLE_REDIS_URL = os.getenv('LOGIN_THROTTLE_REDIS_URL', 'redis://localhost:6379/0')
+    LOGIN_THROTTLE_MAX_KEYS = int(os.getenv('LOGIN_THROTTLE_MAX_KEYS', 100000))
+    LOGIN_THROTTLE_IP_CAPACITY = int(os.getenv('LOGIN_THROTTLE_IP_CAPACITY', 20))
+    LOGIN_THROTTLE_IP_REFILL = float(os.getenv('LOGIN_THROTTLE_IP_REFILL', 0.5))
+    LOGIN_THROTTLE_EMAIL_CAPACITY = int(os.getenv('LOGIN_THROTTLE_EMAIL_CAPACITY', 5))
+    LOGIN_THROTTLE_EMAIL_REFILL = float(os.getenv('LOGIN_THROTTLE_EMAIL_REFILL', 0.05))
+
     ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
-    ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
\ No newline at end of file
+    ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+
+    # 正式環境的 worker 可關閉 Swagger 文件與後台，加快啟動
+    ENABLE_SWAGGER = os.getenv('ENABLE_SWAGGER', 'true').lower() == 'true'
+    ENABLE_ADMIN = os.getenv('ENABLE_ADMIN', 'true').lower() == 'true'
+    # 建置時產生的 OpenAPI 文件（flask openapi build）；檔案不存在時於第一次請求解析 docstring
+    OPENAPI_SPEC_PATH = os.getenv(
+        'OPENAPI_SPEC_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'openapi.json')
+    )
+
+    # 問卷 session：memory（單一 worker）或 db（多個 worker 共用）
+    QUESTIONNAIRE_SESSION_BACKEND = os.getenv('QUESTIONNAIRE_SESSION_BACKEND', 'memory')
+    QUESTIONNAIRE_SESSION_TTL = int(os.getenv('QUESTIONNAIRE_SESSION_TTL', 1800))  # 秒
+    QUESTIONNAIRE_SESSION_MAX = int(os.getenv('QUESTIONNAIRE_SESSION_MAX', 1000))
+
+    # 使用者作答時於背景預先產生兩個選項各自的下一題
+    QUESTIONNAIRE_PREFETCH = os.getenv('QUESTIONNAIRE_PREFETCH', 'false').lower() == 'true'
+    QUESTIONNAIRE_PREFETCH_WORKERS = int(os.getenv('QUESTIONNAIRE_PREFETCH_WORKERS', 4))
+
+    # 以作答路徑快取追問題目；FRESHNESS 為刻意略過快取、交給 LLM 重新產生的比例
+    QUESTION_CACHE = os.getenv('QUESTION_CACHE', 'true').lower() == 'true'
+    QUESTION_CACHE_MAX = int(os.getenv('QUESTION_CACHE_MAX', 5000))
+    QUESTION_CACHE_MAX_AGE = int(os.getenv('QUESTION_CACHE_MAX_AGE', 86400))  # 秒
+    QUESTION_CACHE_FRESHNESS = float(os.getenv('QUESTION_CACHE_FRESHNESS', 0.1))
+    QUESTION_CACHE_PATH = os.getenv('QUESTION_CACHE_PATH')  # 留空則不寫入磁碟
+
+    # 追問題目同時產生的候選數（1 為逐次重試）與單次產生的時間上限
+    QUESTION_CANDIDATES = int(os.getenv('QUESTION_CANDIDATES', 1))
+    QUESTION_CANDIDATE_WORKERS = int(os.getenv('QUESTION_CANDIDATE_WORKERS', 8))
+    QUESTION_DEADLINE = float(os.getenv('QUESTION_DEADLINE')) if os.getenv('QUESTION_DEADLINE') else None  # 秒
+
+    # 對話紀錄放進 prompt 的方式：window（最近幾輪）、summary（背景滾動摘要）、structured（題目與回答清單）
+    QUESTIONNAIRE_MEMORY = os.getenv('QUESTIONNAIRE_MEMORY', 'window')
+    QUESTIONNAIRE_MEMORY_TOKENS = int(os.getenv('QUESTIONNAIRE_MEMORY_TOKENS', 1500))
+
+    # LLM 後端：langchain，或 http（直接呼叫 Ollama API，可沿用上一輪的 context 減少 prefill）
+    OLLAMA_BACKEND = os.getenv('OLLAMA_BACKEND', 'langchain')
+    OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'yi')
+    OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+    OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+    OLLAMA_NUM_CTX = int(os.getenv('OLLAMA_NUM_CTX', 2048))
+    # 收到第一個請求（通常是 /readyz）時在背景預熱模型，之後每 OLLAMA_WARMUP_INTERVAL 秒重新預熱（0 則只預熱一次）
+    OLLAMA_WARMUP = os.getenv('OLLAMA_WARMUP', 'true').lower() == 'true'
+    OLLAMA_WARMUP_INTERVAL = int(os.getenv('OLLAMA_WARMUP_INTERVAL', 600))
+
+    # 新題目與問過的題目估計相似度（字元 n-gram MinHash）達此值即視為重複；1.0 只攔截相同文字
+    QUESTION_DUPLICATE_THRESHOLD = float(os.getenv('QUESTION_DUPLICATE_THRESHOLD', 0.5))
+
+    # 追問逾時（QUESTION_DEADLINE）或失敗時改用的備用題庫；留空 PATH 使用內建題目
+    QUESTION_BANK = os.getenv('QUESTION_BANK', 'true').lower() == 'true'
+    QUESTION_BANK_PATH = os.getenv('QUESTION_BANK_PATH')
+    QUESTION_BANK_MAX = int(os.getenv('QUESTION_BANK_MAX', 500))  # 收錄 LLM 產生題目的上限
+
+    # 本機最近鄰推薦：與已完成問卷的相似度達 THRESHOLD 時直接沿用其推薦，不呼叫 LLM
+    RECOMMENDER = os.getenv('RECOMMENDER', 'true').lower() == 'true'
+    RECOMMENDER_THRESHOLD = float(os.getenv('RECOMMENDER_THRESHOLD', 0.9))
+    RECOMMENDER_MAX = int(os.getenv('RECOMMENDER_MAX', 5000))
+    RECOMMENDER_PATH = os.getenv('RECOMMENDER_PATH')  # 留空則不寫入磁碟
+
+    # 問卷紀錄由背景批次寫入：累積 BATCH_SIZE 筆或每 FLUSH_INTERVAL 秒寫一次，緩衝區滿時丟棄最舊的
+    QUESTIONNAIRE_TRANSCRIPTS = os.getenv('QUESTIONNAIRE_TRANSCRIPTS', 'true').lower() == 'true'
+    TRANSCRIPT_BATCH_SIZE = int(os.getenv('TRANSCRIPT_BATCH_SIZE', 100))
+    TRANSCRIPT_FLUSH_INTERVAL = float(os.getenv('TRANSCRIPT_FLUSH_INTERVAL', 2.0))  # 秒
+    TRANSCRIPT_MAX_BUFFER = int(os.getenv('TRANSCRIPT_MAX_BUFFER', 10000))
+
+    # LLM 併發上限與排隊：超過 LLM_MAX_QUEUE 或排隊超過 LLM_QUEUE_TIMEOUT 秒即回 503
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+    LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', 32))
+    LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', 30))
+    # 預取與額外的平行候選排在即時請求之後，排隊數達此值就略過（預設為 LLM_MAX_QUEUE 的四分之一）
+    LLM_SPECULATIVE_QUEUE = int(os.getenv('LLM_SPECULATIVE_QUEUE')) if os.getenv('LLM_SPECULATIVE_QUEUE') else None
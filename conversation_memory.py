@@ -0,0 +1,212 @@
+from concurrent.futures import ThreadPoolExecutor
+import re
+import threading
+
+DEFAULT_TOKEN_BUDGET = 1500
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓字元與全形標點約一字一 token，其餘約四個字元一 token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def fit_to_budget(lines, token_budget):
+    """由新到舊保留能放進預算的行；最新一行本身就超過預算時截斷它"""
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            if not kept:
+                kept.append(line[-token_budget:])
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(reversed(kept))
+
+
+class ChatMessage:
+    """對話中的一則訊息；記憶只需要 type 與 content，不必載入 langchain 的訊息類別"""
+
+    __slots__ = ("content",)
+    type = None
+
+    def __init__(self, content):
+        self.content = content
+
+
+class HumanMessage(ChatMessage):
+    type = "human"
+
+
+class AIMessage(ChatMessage):
+    type = "ai"
+
+
+class WindowMemory:
+    """保留完整對話，但組 prompt 時只放進 token 預算內最新的幾輪"""
+
+    strategy = "window"
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.messages = []
+
+    def add_user_message(self, content):
+        self.messages.append(HumanMessage(content=content))
+
+    def add_ai_message(self, content):
+        self.messages.append(AIMessage(content=content))
+
+    def format_lines(self, messages):
+        return [
+            f"{'Human' if message.type == 'human' else 'AI'}: {message.content}"
+            for message in messages
+        ]
+
+    def render(self, messages=None):
+        messages = self.messages if messages is None else messages
+        return fit_to_budget(self.format_lines(messages), self.token_budget)
+
+    def refresh(self, session_id):
+        pass
+
+    def maintain(self, session_id):
+        pass
+
+    def release(self, session_id):
+        pass
+
+    def to_state(self):
+        return {}
+
+    def load_state(self, state):
+        pass
+
+
+class StructuredMemory(WindowMemory):
+    """只保留「題目 → 回答」的精簡清單，省略選項與格式文字"""
+
+    strategy = "structured"
+
+    def format_lines(self, messages):
+        lines = []
+        question = None
+        for message in messages:
+            if message.type == "ai":
+                question = message.content.strip().split("\n")[0]
+            else:
+                lines.append(f"{question or '問題：（無）'} → 回答：{message.content}")
+                question = None
+        if question:
+            lines.append(question)
+        return lines
+
+
+_summary_pool = None
+_pool_lock = threading.Lock()
+_summary_lock = threading.Lock()
+_pending_summaries = {}  # session_id -> (摘要涵蓋到的訊息數, future)
+# 放棄的問卷不會再來取摘要，超過上限就丟掉最舊的
+MAX_PENDING_SUMMARIES = 1000
+
+
+def _get_summary_pool():
+    global _summary_pool
+    with _pool_lock:
+        if _summary_pool is None:
+            _summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+        return _summary_pool
+
+
+class RollingSummaryMemory(WindowMemory):
+    """
+    較舊的對話在背景濃縮成摘要，prompt 只放摘要加上最近幾輪。
+    摘要在使用者作答時產生；尚未完成（或由其他 worker 接手）時仍以視窗方式控制長度。
+    """
+
+    strategy = "summary"
+    # 保留最新這麼多則訊息不濃縮，讓模型看得到原文
+    KEEP_RECENT = 4
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, summarizer=None):
+        super().__init__(token_budget)
+        self.summarizer = summarizer
+        self.summary = ""
+        self.summarized_count = 0
+
+    def refresh(self, session_id):
+        """套用背景已完成的摘要"""
+        with _summary_lock:
+            pending = _pending_summaries.get(session_id)
+            if pending is None or not pending[1].done():
+                return
+            del _pending_summaries[session_id]
+        count, future = pending
+        try:
+            summary = future.result()
+        except Exception as e:
+            print(f"⚠️ 對話摘要失敗：{e}")
+            return
+        if count > self.summarized_count:
+            self.summary = summary.strip()
+            self.summarized_count = count
+
+    def render(self, messages=None):
+        messages = self.messages if messages is None else messages
+        if not self.summary:
+            return super().render(messages)
+        summary = fit_to_budget([f"摘要：{self.summary}"], self.token_budget // 2)
+        recent = fit_to_budget(
+            self.format_lines(messages[self.summarized_count:]),
+            self.token_budget - estimate_tokens(summary) - 1
+        )
+        return f"{summary}\n{recent}"
+
+    def maintain(self, session_id):
+        """未濃縮的部分超過預算一半時，在背景把它併入摘要"""
+        if self.summarizer is None:
+            return
+        target = len(self.messages) - self.KEEP_RECENT
+        if target <= self.summarized_count:
+            return
+        unsummarized = "\n".join(self.format_lines(self.messages[self.summarized_count:]))
+        if estimate_tokens(unsummarized) <= self.token_budget // 2:
+            return
+        with _summary_lock:
+            if session_id in _pending_summaries:
+                return
+            lines = "\n".join(self.format_lines(self.messages[self.summarized_count:target]))
+            future = _get_summary_pool().submit(self.summarizer, self.summary, lines)
+            _pending_summaries[session_id] = (target, future)
+            while len(_pending_summaries) > MAX_PENDING_SUMMARIES:
+                _pending_summaries.pop(next(iter(_pending_summaries)))[1].cancel()
+
+    def release(self, session_id):
+        with _summary_lock:
+            pending = _pending_summaries.pop(session_id, None)
+        if pending:
+            pending[1].cancel()
+
+    def to_state(self):
+        return {"summary": self.summary, "summarized_count": self.summarized_count}
+
+    def load_state(self, state):
+        self.summary = state.get("summary", "")
+        self.summarized_count = state.get("summarized_count", 0)
+
+
+MEMORY_STRATEGIES = {
+    "window": WindowMemory,
+    "structured": StructuredMemory,
+    "summary": RollingSummaryMemory,
+}
+
+
+def create_memory(strategy="window", token_budget=DEFAULT_TOKEN_BUDGET, summarizer=None):
+    if strategy == "summary":
+        return RollingSummaryMemory(token_budget, summarizer=summarizer)
+    return MEMORY_STRATEGIES[strategy](token_budget)
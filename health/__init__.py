@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+health_bp = Blueprint('health', __name__)
+
+from . import routes  # 匯入 routes 來綁定 blueprint
@@ -0,0 +1,64 @@
+from flask import jsonify, current_app
+from extensions import db
+from . import health_bp
+
+def _check_database():
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        return {'ok': True}
+    except Exception as e:
+        db.session.rollback()
+        return {'ok': False, 'error': str(e)}
+
+def _llm_status():
+    warmup = current_app.extensions.get('llm_warmup')
+    if warmup is None:
+        # 沒有啟用預熱時不以 LLM 狀態決定是否接收流量
+        return {'ready': True, 'warmup': False}
+    return dict(warmup.status(), warmup=True)
+
+@health_bp.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    存活檢查：回報資料庫連線與 LLM 預熱狀態，只有資料庫無法連線時回 503
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: 服務正常
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: ok
+            database:
+              type: object
+            llm:
+              type: object
+      503:
+        description: 資料庫無法連線
+    """
+    database = _check_database()
+    body = {'status': 'ok' if database['ok'] else 'error', 'database': database, 'llm': _llm_status()}
+    return jsonify(body), 200 if database['ok'] else 503
+
+@health_bp.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    就緒檢查：資料庫可連線且 Ollama 模型已預熱完成才回 200，供負載平衡器只把流量導向已預熱的實例
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: 可以接收流量
+      503:
+        description: 資料庫無法連線或模型尚未載入
+    """
+    database = _check_database()
+    llm = _llm_status()
+    ready = database['ok'] and llm['ready']
+    body = {'status': 'ready' if ready else 'not_ready', 'database': database, 'llm': llm}
+    return jsonify(body), 200 if ready else 503
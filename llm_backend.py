@@ -0,0 +1,157 @@
+from collections import namedtuple
+import json
+
+import requests
+
+# context：Ollama 回傳的對話 token，下次帶回去即可沿用已計算過的前綴；prompt_eval_count：本次實際 prefill 的 token 數
+GenerationResult = namedtuple("GenerationResult", ["text", "context", "prompt_eval_count"])
+
+
+class StreamingGeneration:
+    """
+    逐段產生文字；迭代結束後可從 result 取得完整結果。
+    中途停止迭代後仍可呼叫 drain() 讀完剩下的輸出，以取得 Ollama 最後才回傳的 context
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.text = ""
+        self.result = None
+
+    def __iter__(self):
+        for chunk, final in self._chunks:
+            if final is not None:
+                self.result = final
+                return
+            self.text += chunk
+            yield chunk
+        if self.result is None:
+            self.result = GenerationResult(self.text, None, None)
+
+    def drain(self):
+        for _ in self:
+            pass
+        return self.result
+
+
+class LangChainOllamaBackend:
+    """透過 langchain 的 Ollama 呼叫，不支援延續 context"""
+
+    supports_context = False
+
+    def __init__(self, model_name="yi", temperature=0.3, base_url="http://localhost:11434",
+                 keep_alive=None, num_ctx=None):
+        from langchain_community.llms import Ollama
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.llm = Ollama(model=model_name, temperature=temperature, base_url=base_url,
+                          keep_alive=keep_alive, num_ctx=num_ctx)
+
+    def invoke(self, prompt, context=None):
+        return GenerationResult(self.llm.invoke(prompt), None, None)
+
+    def warm_up(self, timeout=300):
+        # 空的 prompt 只會讓 Ollama 把模型載入記憶體，不會產生文字
+        payload = {"model": self.model_name, "prompt": ""}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        response = requests.post(f"{self.base_url}/api/generate", json=payload, timeout=timeout)
+        response.raise_for_status()
+
+    def stream(self, prompt, context=None):
+        return StreamingGeneration((chunk, None) for chunk in self.llm.stream(prompt))
+
+
+class OllamaHTTPBackend:
+    """
+    直接呼叫 Ollama 的 /api/generate。
+    帶入上一輪回傳的 context 時，Ollama 只需 prefill 新加入的 prompt；
+    keep_alive 讓模型在兩次作答之間留在記憶體中。
+    """
+
+    supports_context = True
+
+    def __init__(self, model_name="yi", temperature=0.3, base_url="http://localhost:11434",
+                 keep_alive="30m", num_ctx=2048, timeout=120):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.base_url = base_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.timeout = timeout
+        self.http = requests.Session()
+
+    def _payload(self, prompt, context, stream):
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {"temperature": self.temperature, "num_ctx": self.num_ctx}
+        }
+        if context:
+            payload["context"] = context
+        return payload
+
+    def invoke(self, prompt, context=None):
+        response = self.http.post(
+            f"{self.base_url}/api/generate",
+            json=self._payload(prompt, context, stream=False),
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        return GenerationResult(data.get("response", ""), data.get("context"), data.get("prompt_eval_count"))
+
+    def warm_up(self, timeout=300):
+        """只載入模型並依 keep_alive 常駐，不產生文字；模型第一次載入可能需要數十秒"""
+        response = self.http.post(
+            f"{self.base_url}/api/generate",
+            json={"model": self.model_name, "prompt": "", "keep_alive": self.keep_alive},
+            timeout=timeout
+        )
+        response.raise_for_status()
+
+    def stream(self, prompt, context=None):
+        def chunks():
+            with self.http.post(
+                f"{self.base_url}/api/generate",
+                json=self._payload(prompt, context, stream=True),
+                timeout=self.timeout,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                text = ""
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("done"):
+                        yield "", GenerationResult(text, data.get("context"), data.get("prompt_eval_count"))
+                        return
+                    text += data.get("response", "")
+                    yield data.get("response", ""), None
+
+        return StreamingGeneration(chunks())
+
+
+LLM_BACKENDS = {
+    "langchain": LangChainOllamaBackend,
+    "http": OllamaHTTPBackend,
+}
+
+
+def create_backend(name="langchain", **kwargs):
+    return LLM_BACKENDS[name](**kwargs)
+
+
+def backend_from_config(config):
+    return create_backend(
+        config['OLLAMA_BACKEND'],
+        model_name=config['OLLAMA_MODEL'],
+        base_url=config['OLLAMA_BASE_URL'],
+        keep_alive=config['OLLAMA_KEEP_ALIVE'],
+        num_ctx=config['OLLAMA_NUM_CTX']
+    )
@@ -0,0 +1,243 @@
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+from llm_backend import StreamingGeneration
+
+
+class QueueFull(Exception):
+    """LLM 佇列已滿或等待逾時；retry_after 為建議客戶端重試前等待的秒數"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"LLM 佇列已滿，請於 {retry_after} 秒後重試")
+        self.retry_after = retry_after
+
+
+class CallAbandoned(Exception):
+    """投機性呼叫在取得名額前就被放棄（例如使用者選了另一個預取分支）"""
+
+
+class _Ticket:
+    """排隊中的一次呼叫；owner 被 promote 時改到一般佇列，被 abandon 時放棄排隊"""
+
+    __slots__ = ('owner', 'speculative', 'abandoned')
+
+    def __init__(self, owner, speculative):
+        self.owner = owner
+        self.speculative = speculative
+        self.abandoned = False
+
+
+class LLMDispatcher:
+    """
+    所有 LLM 呼叫的共同入口：同時執行的數量不超過 max_concurrency，
+    其餘依使用者輪流排隊（同一位使用者的多個請求不會擠掉其他人），
+    排隊數超過 max_queue 時立即拒絕，讓 API 回 503 + Retry-After。
+    預取、額外的平行候選等投機性呼叫（speculative）排在所有即時請求之後，
+    排隊數達 speculative_queue 時就不再接受，留下空間給使用者正在等待的請求。
+    使用者開始等待某個投機性呼叫的結果時以 promote 改為一般優先權，不再需要時以 abandon 放棄排隊。
+    """
+
+    def __init__(self, max_concurrency=2, max_queue=32, queue_timeout=30, speculative_queue=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.speculative_queue = max_queue // 4 if speculative_queue is None else speculative_queue
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queues = OrderedDict()  # 使用者 -> 等待中的 ticket
+        self._speculative_queues = OrderedDict()  # 同上，只有沒有即時請求在等時才輪到
+        self._waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.promoted = 0
+        self.abandoned = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_service = 0.0
+        self.completed = 0
+
+    def retry_after(self):
+        """依平均處理時間估計佇列消化所需的秒數"""
+        average = self.total_service / self.completed if self.completed else 1.0
+        rounds = (self._waiting + self._active) / self.max_concurrency
+        return max(1, math.ceil(average * rounds))
+
+    def check_admission(self):
+        """佇列已滿時立即拋出 QueueFull，供無法在中途改回 503 的串流請求事先檢查"""
+        with self._cond:
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(self.retry_after())
+
+    def _grant(self, waited):
+        self._active += 1
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def _acquire(self, user_key, owner=None):
+        start = time.monotonic()
+        with self._cond:
+            if owner is not None and owner.abandoned:
+                raise CallAbandoned()
+            speculative = owner is not None and owner.speculative
+            if self._active < self.max_concurrency and not self._waiting:
+                self._grant(0.0)
+                return
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(self.retry_after())
+            if speculative and self._waiting >= self.speculative_queue:
+                self.shed += 1
+                raise QueueFull(self.retry_after())
+
+            ticket = _Ticket(owner, speculative)
+            self._enqueue(user_key, ticket)
+            deadline = start + self.queue_timeout if self.queue_timeout else None
+            try:
+                while not (self._active < self.max_concurrency and self._next_ticket() is ticket):
+                    if ticket.abandoned:
+                        raise CallAbandoned()
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.timed_out += 1
+                        raise QueueFull(self.retry_after())
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._remove(user_key, ticket)
+                self._cond.notify_all()
+                raise
+            self._remove(user_key, ticket, served=True)
+            self._grant(time.monotonic() - start)
+            # 下一位可能也能開始（例如 max_concurrency 還有空位）
+            self._cond.notify_all()
+
+    def _next_ticket(self):
+        queues = self._queues or self._speculative_queues
+        if not queues:
+            return None
+        return next(iter(queues.values()))[0]
+
+    def _enqueue(self, user_key, ticket):
+        queues = self._speculative_queues if ticket.speculative else self._queues
+        queues.setdefault(user_key, deque()).append(ticket)
+        self._waiting += 1
+
+    def _remove(self, user_key, ticket, served=False):
+        queues = self._speculative_queues if ticket.speculative else self._queues
+        queue = queues.get(user_key)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        self._waiting -= 1
+        if not queue:
+            del queues[user_key]
+        elif served:
+            # 輪到下一位使用者，達成各使用者之間的公平排隊
+            queues.move_to_end(user_key)
+
+    def _release(self, service_time):
+        with self._cond:
+            self._active -= 1
+            self.completed += 1
+            self.total_service += service_time
+            self._cond.notify_all()
+
+    def _owned_tickets(self, owner):
+        queue = self._speculative_queues.get(owner.user_key, ())
+        return [ticket for ticket in queue if ticket.owner is owner]
+
+    def promote(self, owner):
+        """owner 之後的呼叫改以一般優先權排隊，正在投機性佇列等待的移到該使用者一般佇列的最後"""
+        with self._cond:
+            owner.speculative = False
+            for ticket in self._owned_tickets(owner):
+                self._remove(owner.user_key, ticket)
+                ticket.speculative = False
+                self._enqueue(owner.user_key, ticket)
+            self.promoted += 1
+            self._cond.notify_all()
+
+    def abandon(self, owner):
+        """owner 正在排隊與之後的投機性呼叫都放棄（拋出 CallAbandoned），已在執行的不受影響"""
+        with self._cond:
+            owner.abandoned = True
+            for ticket in self._owned_tickets(owner):
+                ticket.abandoned = True
+            self.abandoned += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, user_key=None, owner=None):
+        """owner 為發出呼叫的 DispatchedBackend，依它目前是否為投機性呼叫決定排在哪個佇列"""
+        self._acquire(user_key, owner)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def wrap(self, backend, user_key=None, speculative=False):
+        return DispatchedBackend(backend, self, user_key, speculative)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self._active,
+                "queue_depth": self._waiting,
+                "queued_users": len(self._queues),
+                "speculative_queued_users": len(self._speculative_queues),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "shed": self.shed,
+                "promoted": self.promoted,
+                "abandoned": self.abandoned,
+                "timed_out": self.timed_out,
+                "avg_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+                "max_wait": self.max_wait,
+                "avg_service": self.total_service / self.completed if self.completed else 0.0
+            }
+
+
+class DispatchedBackend:
+    """把某位使用者的 LLM 呼叫都經過 dispatcher 排隊；介面與被包裝的後端相同"""
+
+    def __init__(self, backend, dispatcher, user_key=None, speculative=False):
+        self.backend = backend
+        self.dispatcher = dispatcher
+        self.user_key = user_key
+        self.speculative = speculative
+        self.abandoned = False
+
+    def fork(self):
+        """相同設定的新後端，可以單獨 promote 或 abandon（例如每個預取分支各用一個）"""
+        return DispatchedBackend(self.backend, self.dispatcher, self.user_key, self.speculative)
+
+    def promote(self):
+        self.dispatcher.promote(self)
+
+    def abandon(self):
+        self.dispatcher.abandon(self)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def invoke(self, prompt, context=None):
+        with self.dispatcher.slot(self.user_key, self):
+            return self.backend.invoke(prompt, context)
+
+    def stream(self, prompt, context=None):
+        def chunks():
+            # 串流期間一直占用名額，直到讀完或呼叫端停止讀取
+            with self.dispatcher.slot(self.user_key, self):
+                generation = self.backend.stream(prompt, context)
+                for chunk in generation:
+                    yield chunk, None
+                yield "", generation.result
+
+        return StreamingGeneration(chunks())
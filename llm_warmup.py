@@ -0,0 +1,88 @@
+import threading
+import time
+
+from llm_backend import backend_from_config
+
+
+class LLMWarmup:
+    """
+    在背景預先載入題目模板，並把設定的 Ollama 模型載入記憶體，讓部署後或閒置後的第一份問卷不必等待。
+    成功後每 interval 秒再預熱一次，避免模型因 keep_alive 到期被卸載；失敗時以指數退避重試。
+    ready 表示最近一次預熱成功，供 /readyz 判斷是否接收流量。
+    """
+
+    def __init__(self, app, interval=600, max_backoff=60):
+        self.app = app
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.ready = False
+        self.last_error = None
+        self.last_success = None
+        self.load_seconds = None
+        self.attempts = 0
+        self._backend = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="llm-warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def warm_up(self):
+        start = time.monotonic()
+        self.attempts += 1
+        try:
+            if self._backend is None:
+                self._backend = backend_from_config(self.app.config)
+            self._backend.warm_up()
+        except Exception as e:
+            self.ready = False
+            self.last_error = str(e)
+            return False
+        self.load_seconds = time.monotonic() - start
+        self.last_success = time.time()
+        self.last_error = None
+        self.ready = True
+        return True
+
+    def _preload(self):
+        # 啟動時延後匯入的 langchain 在這裡先載入，第一個請求不必負擔
+        from ollama_agent import OllamaMultiTurnAgent
+        OllamaMultiTurnAgent.preload()
+
+    def _run(self):
+        try:
+            self._preload()
+        except Exception as e:
+            print(f"⚠️ 預先載入題目模板失敗：{e}")
+        backoff = 1
+        while not self._stop.is_set():
+            if self.warm_up():
+                backoff = 1
+                if not self.interval:
+                    return
+                self._stop.wait(self.interval)
+            else:
+                print(f"⚠️ Ollama 模型預熱失敗，{backoff} 秒後重試：{self.last_error}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "model": self.app.config['OLLAMA_MODEL'],
+            "attempts": self.attempts,
+            "load_seconds": self.load_seconds,
+            "last_success": self.last_success,
+            "last_error": self.last_error
+        }
+
+
+def start_warmup(app):
+    warmup = LLMWarmup(app, interval=app.config['OLLAMA_WARMUP_INTERVAL']).start()
+    app.extensions['llm_warmup'] = warmup
+    return warmup
@@ -1,11 +1,26 @@
+import threading
+
 from flask import Flask
 from flask_cors import CORS
 from config import Config
 from extensions import db, jwt, mail, migrate
-from flask_migrate import upgrade
 from models import User
-from flasgger import Swagger
-from admin import register_admin
+from api_spec import init_api_spec, openapi_cli
+
+def start_on_first_request(app, start):
+    """
+    flask db upgrade、openapi、rollups 等 CLI 指令也會呼叫 create_app；
+    背景執行緒改在第一個請求時才啟動，只有實際提供服務的 process 會啟動
+    """
+    lock = threading.Lock()
+    pending = [start]
+
+    @app.before_request
+    def _start_background_worker():
+        if pending:
+            with lock:
+                if pending:
+                    pending.pop()(app)
 
 def create_app():
     app = Flask(__name__)
@@ -18,31 +33,33 @@ def create_app():
 
     CORS(app)
 
-    swagger = Swagger(app, template={
-        "swagger": "2.0",
-        "info": {
-            "title": "Project API",
-            "description": "Flask + Swagger + JWT 認證文件",
-            "version": "1.0"
-        },
-        "securityDefinitions": {
-            "Bearer": {
-                "type": "apiKey",
-                "name": "Authorization",
-                "in": "header",
-                "description": "請輸入 JWT：Bearer <你的 token>"
-            }
-        }
-    })
+    if app.config['ENABLE_SWAGGER']:
+        # flasgger 與 Flask-Admin 匯入較慢，只在啟用時載入
+        init_api_spec(app)
+    app.cli.add_command(openapi_cli)
 
     from auth import auth_bp
     app.register_blueprint(auth_bp)
     from users import users_bp
+    from users.rollups import rollups_cli
     app.register_blueprint(users_bp)
+    app.cli.add_command(rollups_cli)
     from questionnaire import questionnaire_bp
     app.register_blueprint(questionnaire_bp)
+    from health import health_bp
+    app.register_blueprint(health_bp)
+
+    if app.config['ENABLE_ADMIN']:
+        from admin import register_admin
+        register_admin(app)
+
+    if app.config['EMAIL_SENDER']:
+        from auth.email_outbox import start_email_sender
+        start_on_first_request(app, start_email_sender)
 
-    register_admin(app)
+    if app.config['OLLAMA_WARMUP']:
+        from llm_warmup import start_warmup
+        start_on_first_request(app, start_warmup)
 
     return app
 
@@ -1,6 +1,7 @@
 from extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import date
+from password_hasher import get_password_hasher
+from text_search import diary_terms
+from datetime import date, datetime
 from sqlalchemy.dialects.postgresql import ARRAY
 
 class User(db.Model):
@@ -18,11 +19,20 @@ class User(db.Model):
 
     @password.setter
     def password(self, raw_password):
-        self.password_hash = generate_password_hash(raw_password)
+        self.password_hash = get_password_hasher().hash(raw_password)
 
     def check_password(self, raw_password):
-        return check_password_hash(self.password_hash, raw_password)
+        """密碼正確且雜湊設定已變更時順便換成新的雜湊，由呼叫端 commit"""
+        hasher = get_password_hasher()
+        if not hasher.verify(self.password_hash, raw_password):
+            return False
+        if hasher.needs_rehash(self.password_hash):
+            self.password_hash = hasher.hash(raw_password)
+        return True
     
+# 日記全文檢索的 tsvector；查詢必須使用完全相同的運算式才會用到 GIN 索引
+MOOD_LOG_SEARCH_VECTOR = "to_tsvector('simple', coalesce(search_terms, ''))"
+
 class MoodLog(db.Model):
     __tablename__ = 'mood_logs'
     id = db.Column(db.Integer, primary_key=True)
@@ -30,16 +40,100 @@ class MoodLog(db.Model):
     date = db.Column(db.Date, nullable=False, default=date.today)
     mood = db.Column(db.String(50))
     diary = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)  # 軟刪除，讓增量同步能把刪除傳給其他裝置
+    search_terms = db.deferred(db.Column(db.Text, nullable=True))  # 日記斷詞結果，隨 diary 更新，供全文檢索
 
     user = db.relationship('User', backref=db.backref('mood_logs', lazy=True))
 
     __table_args__ = (
         db.UniqueConstraint('user_id', 'date', name='uix_user_date'),
+        db.Index('ix_mood_logs_user_id_updated_at', 'user_id', 'updated_at', 'id'),
+        db.Index(
+            'ix_mood_logs_search_terms',
+            db.text(MOOD_LOG_SEARCH_VECTOR),
+            postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
     )
 
+@db.event.listens_for(MoodLog.diary, 'set')
+def _update_search_terms(target, value, oldvalue, initiator):
+    target.search_terms = diary_terms(value)
+
+class MoodRollup(db.Model):
+    """每位使用者每週、每月各心情的紀錄數與寫了日記的天數，隨寫入更新"""
+    __tablename__ = 'mood_rollups'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)  # week 或 month
+    period_start = db.Column(db.Date, primary_key=True)  # 週一或每月一日
+    mood = db.Column(db.String(50), primary_key=True)
+    entries = db.Column(db.Integer, nullable=False, default=0)
+    diaries = db.Column(db.Integer, nullable=False, default=0)
+
+class MoodStreak(db.Model):
+    """連續紀錄天數；current_length 為到 last_date 為止的連續天數"""
+    __tablename__ = 'mood_streaks'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    last_date = db.Column(db.Date, nullable=False)
+    current_length = db.Column(db.Integer, nullable=False)
+    longest_length = db.Column(db.Integer, nullable=False)
+
 class UserProfile(db.Model):
     __tablename__ = 'user_profiles'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     activity = db.Column(ARRAY(db.Text), nullable=True)
-    profile_image = db.Column(db.String(256), nullable=True)
\ No newline at end of file
+    profile_image = db.Column(db.String(256), nullable=True)
+
+class QuestionnaireSession(db.Model):
+    __tablename__ = 'questionnaire_sessions'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    state = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class QuestionnaireTurn(db.Model):
+    __tablename__ = 'questionnaire_turns'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    session_id = db.Column(db.String(32), nullable=False, index=True)
+    step = db.Column(db.Integer, nullable=False)
+    answer = db.Column(db.Text, nullable=True)  # 使用者對上一題的回答，第一題為空
+    question = db.Column(db.Text, nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # initial、cache、prefetch、llm、bank
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class QuestionnaireRecommendation(db.Model):
+    __tablename__ = 'questionnaire_recommendations'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    session_id = db.Column(db.String(32), nullable=False)
+    answers = db.Column(db.JSON, nullable=False)  # 作答路徑 [[題目, 所選選項], ...]
+    recommendation = db.Column(db.Text, nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # local 或 llm
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending、sent、failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    token_type = db.Column(db.String(10), nullable=False)  # access 或 refresh
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # 過期後即可刪除
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
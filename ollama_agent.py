@@ -1,24 +1,187 @@
-from langchain_community.llms import Ollama
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
+from conversation_memory import HumanMessage, create_memory, estimate_tokens, DEFAULT_TOKEN_BUDGET
+from llm_backend import LangChainOllamaBackend
+from llm_dispatcher import CallAbandoned, QueueFull
+from question_index import QuestionIndex
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
 import re
+import threading
+import time
+import uuid
+
+MAX_ATTEMPTS = 10
+# 串流時若累積這麼多字仍未出現「問題：」，視為格式錯誤提早重試
+STREAM_PREAMBLE_LIMIT = 80
+GENERATION_FAILED_MESSAGE = "⚠️ 抱歉，無法產生符合格式且不重複的問題。請稍後再試。"
+
+
+def extract_question_block(text):
+    match = re.search(
+        r"(問題：.+?)\n(選項一：.+?)\n(選項二：.+?)(?:\n|$)",
+        text.strip(),
+        re.DOTALL
+    )
+    return '\n'.join(match.groups()).strip() if match else None
+
+
+class LazyPromptTemplate:
+    """
+    題目模板的類別屬性：第一次使用時才匯入 langchain 並建立 PromptTemplate，
+    讓 worker 啟動時不必載入 langchain
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self._prompt = None
+        self._lock = threading.Lock()
+
+    def __get__(self, instance, owner):
+        if self._prompt is None:
+            with self._lock:
+                if self._prompt is None:
+                    from langchain_core.prompts import PromptTemplate
+                    self._prompt = PromptTemplate(**self.kwargs)
+        return self._prompt
+
+
+@lru_cache(maxsize=None)
+def default_backend(model_name="yi"):
+    """未指定後端時，同一個模型在整個 process 共用一個 LLM client"""
+    return LangChainOllamaBackend(model_name=model_name, temperature=0.3)
+
+
+class QuestionnaireState:
+    """
+    一位使用者的問卷進度，由 session store 保存到下一次請求。
+    使用 __slots__ 並以 tuple 與 array 存放，Ollama context 每個 token 只占 4 bytes
+    """
+
+    __slots__ = ("session_id", "step", "previous_questions", "history", "memory",
+                 "llm_context", "context_messages")
+
+    def __init__(self, session_id=None, step=0, previous_questions=(), history=(),
+                 memory=None, llm_context=None, context_messages=0):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.step = step
+        self.previous_questions = tuple(previous_questions)
+        self.history = tuple((role, content) for role, content in history)  # (human|ai, 內容)
+        self.memory = memory or {}
+        self.llm_context = array("i", llm_context) if llm_context else None
+        self.context_messages = context_messages
+
+    def to_dict(self):
+        """可存成 JSON 的格式，供資料庫 session store 使用"""
+        return {
+            "session_id": self.session_id,
+            "step": self.step,
+            "previous_questions": list(self.previous_questions),
+            "history": [list(message) for message in self.history],
+            "memory": self.memory,
+            "llm_context": self.llm_context.tolist() if self.llm_context is not None else None,
+            "context_messages": self.context_messages
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            session_id=data.get("session_id"),
+            step=data["step"],
+            previous_questions=data["previous_questions"],
+            history=data["history"],
+            memory=data.get("memory"),
+            llm_context=data.get("llm_context"),
+            context_messages=data.get("context_messages", 0)
+        )
+
+
+class QuestionPrefetcher:
+    """
+    在使用者作答時，於背景針對兩個選項各預先產生下一題；
+    收到回答後取用相符的分支，另一個分支則取消。
+    以 session_id 為 key，因此只有同一個 worker 接到下一題時才會命中。
+    每個分支可附上自己的 DispatchedBackend：分支被取用時 promote、被取消時 abandon。
+    """
+
+    def __init__(self, max_workers=4, max_pending=100):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="question-prefetch")
+        self.max_pending = max_pending
+        self._pending = OrderedDict()  # key -> {選項: (future, cancel_event, backend)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+    def schedule(self, key, branches):
+        """branches 為 {選項: (generate(cancel_event), backend 或 None)}"""
+        entry = {}
+        for option, (generate, backend) in branches.items():
+            cancel_event = threading.Event()
+            entry[option] = (self.executor.submit(generate, cancel_event), cancel_event, backend)
+
+        with self._lock:
+            stale = [self._pending.pop(key, None)]
+            self._pending[key] = entry
+            # 使用者離開問卷時不會再來取，超過上限就淘汰最舊的預取
+            while len(self._pending) > self.max_pending:
+                stale.append(self._pending.popitem(last=False)[1])
+        for branches in stale:
+            self._cancel(branches)
+
+    def take(self, key, option):
+        """取出與回答相符的 (future, backend)；沒有預取或回答不符任何選項時回傳 (None, None)"""
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            winner = entry.pop(option, None) if entry and option else None
+            if winner is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry:
+            self._cancel(entry)
+        return (winner[0], winner[2]) if winner else (None, None)
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._pending.pop(key, None)
+        self._cancel(entry)
+
+    def _cancel(self, branches):
+        if not branches:
+            return
+        for future, cancel_event, backend in branches.values():
+            cancel_event.set()
+            future.cancel()
+            if backend is not None:
+                backend.abandon()
+        with self._lock:
+            self.cancelled += len(branches)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "cancelled": self.cancelled,
+                "pending": len(self._pending)
+            }
 
 
 class OllamaMultiTurnAgent:
-    def __init__(self, model_name="yi"):
-        self.llm = Ollama(model=model_name, temperature=0.3)
-        self.memory = ConversationBufferMemory(memory_key="chat_history")
-        self.step = 0
-        self.previous_questions = set()
+    """
+    每次請求依 QuestionnaireState 建立的輕量 agent。
+    題目模板與固定題目是類別屬性，整個 process 共用；LLM 後端、快取、題庫等由呼叫端傳入共用的實例
+    """
 
-        self.initial_questions = [
-            "問題：你心情好的時候喜歡待在什麼地方？\n選項一：室內\n選項二：室外",
-            "問題：你心情不好的時候喜歡待在什麼地方？\n選項一：室內\n選項二：室外"
-        ]
+    initial_questions = (
+        "問題：你心情好的時候喜歡待在什麼地方？\n選項一：室內\n選項二：室外",
+        "問題：你心情不好的時候喜歡待在什麼地方？\n選項一：室內\n選項二：室外"
+    )
 
-        self.follow_up_prompt = PromptTemplate(
-            input_variables=["chat_history", "last_answer", "previous_titles"],
-            template="""
+    follow_up_prompt = LazyPromptTemplate(
+        input_variables=["chat_history", "last_answer", "previous_titles"],
+        template="""
 你是一位活動推薦助理，正在根據使用者的回覆進行問卷調查。
 
 你要設計一個「新的問題」，以更了解他的個性與偏好，並使用以下格式：
@@ -32,8 +195,7 @@ class OllamaMultiTurnAgent:
 ⚠️ 請注意：
 1. 僅輸出三行，格式如上。
 2. 問題必須與下列對話內容有關。
-3. 請**避免重複以下問題**或語意相似的問題：
-{previous_titles}
+3. 請**避免重複「已問過的問題」**或語意相似的問題。
 4. 禁止添加開場白、說明或 JSON 包裝。
 5. 僅使用繁體中文輸出。
 
@@ -41,62 +203,630 @@ class OllamaMultiTurnAgent:
 {chat_history}
 
 使用者剛剛回答：{last_answer}
+
+已問過的問題：
+{previous_titles}
 """
-        )
-        self.follow_up_chain = self.follow_up_prompt | self.llm
+    )
+    # 沿用上一輪 context 時只送出新增的部分，規則與格式已在 context 之中
+    follow_up_continue_prompt = LazyPromptTemplate(
+        input_variables=["new_messages", "last_answer", "previous_titles"],
+        template="""
+{new_messages}
+使用者剛剛回答：{last_answer}
 
-        self.summary_prompt = PromptTemplate(
-            input_variables=["chat_history"],
-            template="你是一位活動推薦專家。以下是與使用者的對話內容：\n{chat_history}\n\n請根據這些回答推薦一個最適合他的休閒娛樂活動，並簡短說明推薦原因（不超過100字）。請用繁體中文回答。"
+請依照相同的格式與規則設計下一個新問題。已問過的問題：
+{previous_titles}
+"""
+    )
+
+    summary_prompt = LazyPromptTemplate(
+        input_variables=["chat_history"],
+        template="你是一位活動推薦專家。以下是與使用者的對話內容：\n{chat_history}\n\n請根據這些回答推薦一個最適合他的休閒娛樂活動，並簡短說明推薦原因（不超過100字）。請用繁體中文回答。"
+    )
+    summary_continue_prompt = LazyPromptTemplate(
+        input_variables=["new_messages"],
+        template="{new_messages}\n\n問卷結束。請根據以上所有回答推薦一個最適合他的休閒娛樂活動，並簡短說明推薦原因（不超過100字）。請用繁體中文回答，不要再出題。"
+    )
+
+    history_summary_prompt = LazyPromptTemplate(
+        input_variables=["summary", "chat_history"],
+        template="以下是問卷先前的摘要與新的對話內容，請把它們合併成一段精簡的繁體中文摘要，只保留使用者的偏好與回答重點（不超過150字）。\n\n先前摘要：{summary}\n\n新的對話：\n{chat_history}"
+    )
+
+    @classmethod
+    def preload(cls):
+        """先建立所有題目模板，把匯入 langchain 的時間移到第一個請求之前"""
+        for name in ("follow_up_prompt", "follow_up_continue_prompt", "summary_prompt",
+                     "summary_continue_prompt", "history_summary_prompt"):
+            getattr(cls, name)
+
+    def __init__(self, model_name="yi", prefetcher=None, question_cache=None,
+                 candidate_pool=None, candidates=1, deadline=None,
+                 memory_strategy="window", memory_tokens=DEFAULT_TOKEN_BUDGET, backend=None,
+                 duplicate_threshold=0.5, question_bank=None, recommender=None, speculative_backend=None):
+        self.backend = backend or default_backend(model_name)
+        # 預取與額外的平行候選改用這個後端，讓 dispatcher 把它們排在即時請求之後
+        self.speculative_backend = speculative_backend or self.backend
+        self.memory = create_memory(memory_strategy, memory_tokens, summarizer=self._summarize_history)
+        self.step = 0
+        self.previous_questions = set()
+        # 與問過的題目估計相似度達門檻即視為重複，1.0 則只攔截文字相同的題目
+        self.duplicate_threshold = duplicate_threshold
+        self.title_index = QuestionIndex(threshold=duplicate_threshold)
+        self.session_id = uuid.uuid4().hex
+        self.prefetcher = prefetcher
+        self.question_cache = question_cache
+        # candidates > 1 且提供 candidate_pool 時，同時送出多個候選生成並採用第一個合格的
+        self.candidate_pool = candidate_pool
+        self.candidates = candidates
+        self.deadline = deadline  # 秒；超過就改從備用題庫出題
+        self.question_bank = question_bank
+        # 有相近的已完成問卷時直接沿用它的推薦，不呼叫 LLM
+        self.recommender = recommender
+        self.last_generation_metrics = None
+        # 最近一題（或推薦）的來源：initial、cache、prefetch、llm、bank、local；都失敗時為 failed
+        self.last_source = None
+        # 後端支援時保留 Ollama 上一輪回傳的 context，下一輪只需 prefill 新的回答
+        self.llm_context = None
+        self.context_messages = 0  # context 已涵蓋的訊息數
+
+    def to_state(self):
+        """只輸出對話狀態，供 session store 保存"""
+        return QuestionnaireState(
+            session_id=self.session_id,
+            step=self.step,
+            previous_questions=sorted(self.previous_questions),
+            history=((message.type, message.content) for message in self.memory.messages),
+            memory=self.memory.to_state(),
+            llm_context=self.llm_context,
+            context_messages=self.context_messages
         )
-        self.summary_chain = self.summary_prompt | self.llm
+
+    @classmethod
+    def from_state(cls, state, **kwargs):
+        if isinstance(state, dict):
+            state = QuestionnaireState.from_dict(state)
+        agent = cls(**kwargs)
+        agent.session_id = state.session_id
+        agent.step = state.step
+        agent.previous_questions = set(state.previous_questions)
+        for title in state.previous_questions:
+            agent.title_index.add(title)
+        for role, content in state.history:
+            if role == "human":
+                agent.memory.add_user_message(content)
+            else:
+                agent.memory.add_ai_message(content)
+        agent.memory.load_state(state.memory)
+        # 送給 Ollama 時需要 list
+        agent.llm_context = state.llm_context.tolist() if state.llm_context is not None else None
+        agent.context_messages = state.context_messages
+        return agent
 
     def extract_question_block(self, text):
-        match = re.search(
-            r"(問題：.+?)\n(選項一：.+?)\n(選項二：.+?)(?:\n|$)",
-            text.strip(),
-            re.DOTALL
-        )
-        return '\n'.join(match.groups()).strip() if match else None
+        return extract_question_block(text)
 
     def get_question_title(self, question_text):
         return question_text.strip().split('\n')[0]
 
-    def get_next_question(self, user_answer=None):
+    def get_question_options(self, question_text):
+        lines = question_text.strip().split('\n')[1:3]
+        return [line.split('：', 1)[-1].strip() for line in lines]
+
+    def match_option(self, question_text, answer):
+        """把回答對應到選項文字；自由輸入、不屬於任何選項時回傳 None"""
+        answer = (answer or '').strip()
+        for label, option in zip(("選項一", "選項二"), self.get_question_options(question_text)):
+            if answer in (option, label, f"{label}：{option}"):
+                return option
+        return None
+
+    def answer_path(self, messages):
+        """
+        把對話紀錄正規化為作答路徑：[(題目, 所選選項), ...]；
+        自由輸入的回答只去除多餘空白
+        """
+        path = []
+        for question, answer in zip(messages, messages[1:]):
+            if question.type == "ai" and answer.type == "human":
+                option = self.match_option(question.content, answer.content)
+                path.append([
+                    self.get_question_title(question.content),
+                    option or " ".join(answer.content.split())
+                ])
+        return path
+
+    def _cache_key(self, messages):
+        return self.question_cache.make_key(self.answer_path(messages))
+
+    def check_stream_format(self, text):
+        """
+        串流途中檢查輸出格式：
+        回傳 'complete'（三行皆已完整收到）、'invalid'（已可判定不合格式）或 'pending'
+        """
+        if re.search(r"問題：.+?\n選項一：.+?\n選項二：[^\n]+\n", text, re.DOTALL):
+            return 'complete'
+        if "問題：" not in text and len(text.strip()) > STREAM_PREAMBLE_LIMIT:
+            return 'invalid'
+        return 'pending'
+
+    def _summarize_history(self, summary, chat_history):
+        prompt = self.history_summary_prompt.format(summary=summary or "（無）", chat_history=chat_history)
+        return self.backend.invoke(prompt).text
+
+    def _record_answer(self, user_answer):
+        self.memory.refresh(self.session_id)
         if user_answer:
-            self.memory.chat_memory.add_user_message(user_answer)
+            self.memory.add_user_message(user_answer)
             self.step += 1
 
+    def _accept_question(self, question):
+        self.previous_questions.add(self.get_question_title(question))
+        self.title_index.add(self.get_question_title(question))
+        self.memory.add_ai_message(question)
+        self.memory.maintain(self.session_id)
+
+    def _adopt_context(self, context):
+        # 在 _accept_question 之後呼叫：context 已包含剛接受的題目
+        if context:
+            self.llm_context = context
+            self.context_messages = len(self.memory.messages)
+
+    def _usable_context(self, messages, extra_text=""):
+        """context 仍涵蓋目前對話的開頭、且加上新內容不超過模型視窗時才沿用"""
+        if not self.backend.supports_context or not self.llm_context:
+            return None
+        if self.context_messages > len(messages):
+            return None
+        new_text = "\n".join(self.memory.format_lines(messages[self.context_messages:])) + extra_text
+        num_ctx = getattr(self.backend, "num_ctx", None)
+        if num_ctx and len(self.llm_context) + estimate_tokens(new_text) > num_ctx * 3 // 4:
+            return None
+        return self.llm_context
+
+    def _follow_up_request(self, messages, user_answer, previous_questions):
+        """組出本輪的 prompt；能沿用 context 時只送出 context 之後新增的對話"""
+        previous_titles = "\n".join(previous_questions)
+        context = self._usable_context(messages[:-1], previous_titles)
+        if context:
+            prompt = self.follow_up_continue_prompt.format(
+                new_messages="\n".join(self.memory.format_lines(messages[self.context_messages:-1])),
+                last_answer=user_answer,
+                previous_titles=previous_titles
+            )
+            return prompt, context
+        prompt = self.follow_up_prompt.format(
+            chat_history=self.memory.render(messages),
+            last_answer=user_answer,
+            previous_titles=previous_titles
+        )
+        return prompt, None
+
+    def is_repeated(self, question, title_index=None):
+        if title_index is None:
+            title_index = self.title_index
+        return title_index.is_duplicate(self.get_question_title(question))
+
+    def _validate_candidate(self, raw_output, title_index, attempt):
+        question = self.extract_question_block(raw_output)
+        if not question:
+            print(f"⚠️ 第 {attempt} 次輸出未通過格式驗證：\n{raw_output}\n")
+            return None
+        if self.is_repeated(question, title_index):
+            print(f"⚠️ 第 {attempt} 次問題重複：{self.get_question_title(question)}")
+            return None
+        return question
+
+    def _count_prefill(self, metrics, result):
+        if result.prompt_eval_count is not None:
+            metrics['prefill_tokens'] = (metrics.get('prefill_tokens') or 0) + result.prompt_eval_count
+
+    def _generate_follow_up(self, messages, user_answer, previous_questions, cancel_event=None, metrics=None,
+                            start=None, backend=None):
+        """
+        依給定的對話紀錄產生下一題，不修改 agent 狀態。
+        回傳 (題目, Ollama context)；失敗、逾時或被取消時回傳 (None, None)。
+        deadline 從 start 起算（預設為現在），已先等過預取時不會重新計時；
+        預取時 backend 為該分支的投機性後端，所有呼叫都使用它
+        """
+        prompt, context = self._follow_up_request(messages, user_answer, previous_questions)
+        title_index = QuestionIndex.from_titles(previous_questions, threshold=self.duplicate_threshold)
+        metrics = metrics if metrics is not None else {}
+        if self.candidate_pool is not None and self.candidates > 1:
+            return self._sample_parallel(prompt, context, title_index, cancel_event, metrics, start, backend)
+
+        backend = backend or self.backend
+        start = start if start is not None else time.monotonic()
+        metrics.update(mode='sequential', candidates_issued=0, candidates_wasted=0, winner_latency=None)
+        for i in range(MAX_ATTEMPTS):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            remaining = None
+            if self.deadline is not None:
+                remaining = self.deadline - (time.monotonic() - start)
+                if remaining <= 0:
+                    break
+            metrics['candidates_issued'] += 1
+            try:
+                if remaining is not None and self.candidate_pool is not None:
+                    # 放到 pool 執行才能在期限到時不再等待這次呼叫
+                    future = self.candidate_pool.submit(backend.invoke, prompt, context)
+                    if not wait([future], timeout=remaining).done:
+                        self._salvage([future])
+                        metrics['candidates_wasted'] += 1
+                        break
+                    result = future.result()
+                else:
+                    result = backend.invoke(prompt, context)
+            except QueueFull:
+                # LLM 已滿載，重試只會加重負擔，交由呼叫端回 503
+                raise
+            except CallAbandoned:
+                break
+            except Exception as e:
+                print(f"⚠️ 第 {i+1} 次呼叫 LLM 失敗：{e}")
+                metrics['candidates_wasted'] += 1
+                continue
+            self._count_prefill(metrics, result)
+            question = self._validate_candidate(result.text.strip(), title_index, i + 1)
+            if question:
+                metrics['winner_latency'] = time.monotonic() - start
+                return question, result.context
+            metrics['candidates_wasted'] += 1
+
+        return None, None
+
+    def _sample_parallel(self, prompt, context, title_index, cancel_event, metrics, start=None, backend=None):
+        """
+        同時保持 candidates 個生成在進行，總數上限為 MAX_ATTEMPTS；
+        第一個通過格式與重複檢查的即為結果，其餘取消（已在執行中的結果直接丟棄）。
+        只有一個候選以一般優先權排隊，其餘為投機性呼叫；LLM 繁忙而被略過時只剩一個候選繼續。
+        預取時所有候選都使用 backend
+        """
+        start = start if start is not None else time.monotonic()
+        pending = set()
+        primary = None  # 以一般優先權排隊的候選
+        shed = False
+        issued = 0
+        question = None
+        winner_context = None
+        rejected = None
+        metrics.update(mode='parallel', candidates_issued=0, candidates_wasted=0, winner_latency=None)
+        while question is None:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            timeout = None
+            if self.deadline is not None:
+                timeout = self.deadline - (time.monotonic() - start)
+                if timeout <= 0:
+                    break
+            while len(pending) < (1 if shed else self.candidates) and issued < MAX_ATTEMPTS:
+                if backend is not None:
+                    pending.add(self.candidate_pool.submit(backend.invoke, prompt, context))
+                elif primary in pending:
+                    pending.add(self.candidate_pool.submit(self.speculative_backend.invoke, prompt, context))
+                else:
+                    primary = self.candidate_pool.submit(self.backend.invoke, prompt, context)
+                    pending.add(primary)
+                issued += 1
+            if not pending:
+                break
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    result = future.result()
+                except QueueFull as e:
+                    if backend is not None or future is primary:
+                        rejected = e
+                    else:
+                        shed = True
+                    continue
+                except CallAbandoned:
+                    continue
+                except Exception as e:
+                    print(f"⚠️ 候選問題產生失敗：{e}")
+                    continue
+                self._count_prefill(metrics, result)
+                question = self._validate_candidate(result.text.strip(), title_index, issued)
+                if question:
+                    metrics['winner_latency'] = time.monotonic() - start
+                    winner_context = result.context
+                    break
+
+        self._salvage(pending)
+        metrics['candidates_issued'] = issued
+        metrics['candidates_wasted'] = issued - (1 if question else 0)
+        if question is None and rejected is not None:
+            raise rejected
+        return question, winner_context
+
+    def _salvage(self, futures):
+        """取消還沒開始的生成；已在執行中的，完成後收進備用題庫而不是直接丟棄"""
+        for future in futures:
+            if not future.cancel() and self.question_bank is not None:
+                future.add_done_callback(self._bank_result)
+
+    def _bank_result(self, future):
+        try:
+            self.question_bank.add(future.result().text)
+        except Exception:
+            pass
+
+    def _bank_prefetched(self, future):
+        try:
+            question, _ = future.result()
+        except Exception:
+            return
+        if question:
+            self.question_bank.add(question)
+
+    def _fallback_question(self):
+        if self.question_bank is None:
+            return None
+        return self.question_bank.pick(self.title_index)
+
+    def _schedule_prefetch(self, question):
+        # 下一題仍是固定題目時不需要預取
+        if self.prefetcher is None or self.step + 1 < len(self.initial_questions):
+            return
+        messages = list(self.memory.messages)
+        previous_questions = set(self.previous_questions)
+        branches = {}
+        for option in self.get_question_options(question):
+            branch_messages = messages + [HumanMessage(content=option)]
+            # 快取裡已經有這個分支的下一題，就不必再讓 LLM 產生
+            if self.question_cache is not None and self.question_cache.peek(self._cache_key(branch_messages)):
+                continue
+            backend = self._branch_backend()
+            generate = (lambda cancel_event, branch_messages=branch_messages, option=option, backend=backend:
+                        self._generate_follow_up(branch_messages, option, previous_questions, cancel_event,
+                                                 backend=backend))
+            # 沒有經過 dispatcher 的後端不需要 promote 或 abandon
+            branches[option] = (generate, backend if backend is not self.speculative_backend else None)
+        if branches:
+            self.prefetcher.schedule((self.session_id, self.step + 1), branches)
+
+    def _branch_backend(self):
+        # 每個預取分支各用一個後端，分支被取用或取消時只影響它自己排隊中的呼叫
+        fork = getattr(self.speculative_backend, 'fork', None)
+        return fork() if fork is not None else self.speculative_backend
+
+    def _take_prefetched(self, user_answer, start):
+        """
+        回傳 (題目, Ollama context)，沒有可用的預取結果時回傳 (None, None)。
+        start 為這次出題開始的時間，等待預取不會超過 deadline
+        """
+        if self.prefetcher is None:
+            return None, None
+        messages = self.memory.messages
+        last_question = messages[-2].content if len(messages) >= 2 else ''
+        option = self.match_option(last_question, user_answer)
+        future, backend = self.prefetcher.take((self.session_id, self.step), option)
+        if future is None:
+            return None, None
+        promoted = False
+        if not future.done():
+            # 預取還在排隊就取消，直接即時產生
+            if future.cancel():
+                return None, None
+            # 已開始的分支由這次請求接手：它在 dispatcher 的呼叫改以一般優先權排隊，
+            # 不會排在其他人的即時請求之後；等待的上限與即時產生相同（LLM_QUEUE_TIMEOUT 與 deadline）
+            if backend is not None:
+                backend.promote()
+                promoted = True
+            if self.deadline is not None:
+                remaining = max(0, self.deadline - (time.monotonic() - start))
+                if not wait([future], timeout=remaining).done:
+                    # 逾時的預取完成後仍收進備用題庫
+                    if self.question_bank is not None:
+                        future.add_done_callback(self._bank_prefetched)
+                    return None, None
+        try:
+            question, context = future.result()
+        except QueueFull:
+            # 接手後仍排不到名額，與即時產生一樣回 503，不再重新排隊一次
+            if promoted:
+                raise
+            return None, None
+        except Exception as e:
+            print(f"⚠️ 預取下一題失敗：{e}")
+            return None, None
+        if question and not self.is_repeated(question):
+            return question, context
+        return None, None
+
+    def _reuse_question(self, user_answer, start):
+        """
+        依序嘗試作答路徑快取與預取結果，回傳 (題目, Ollama context)；
+        都沒有時回傳 (None, None) 交由 LLM 即時產生
+        """
+        if self.question_cache is not None:
+            question = self.question_cache.get(self._cache_key(self.memory.messages))
+            if question and not self.is_repeated(question):
+                if self.prefetcher is not None:
+                    self.prefetcher.discard((self.session_id, self.step))
+                self.last_source = 'cache'
+                return question, None
+        question, context = self._take_prefetched(user_answer, start)
+        if question:
+            self._cache_question(question)
+            self.last_source = 'prefetch'
+        return question, context
+
+    def _cache_question(self, question):
+        if self.question_cache is not None:
+            self.question_cache.put(self._cache_key(self.memory.messages), question)
+
+    def _accept_generated(self, question):
+        self._cache_question(question)
+        if self.question_bank is not None:
+            self.question_bank.add(question)
+        self.last_source = 'llm'
+
+    def get_next_question(self, user_answer=None):
+        """
+        回傳下一題；LLM、快取與備用題庫都拿不到題目時回傳 None（last_source 為 failed）。
+        LLM 佇列已滿時拋出 QueueFull
+        """
+        self._record_answer(user_answer)
+
+        context = None
+        self.last_generation_metrics = None
+        start = time.monotonic()
         if self.step < len(self.initial_questions):
             question = self.initial_questions[self.step]
-            self.memory.chat_memory.add_ai_message(question)
-            self.previous_questions.add(self.get_question_title(question))
-            return question
+            self.last_source = 'initial'
+        else:
+            question, context = self._reuse_question(user_answer, start)
+            if question is None:
+                self.last_generation_metrics = {}
+                question, context = self._generate_follow_up(
+                    self.memory.messages, user_answer, self.previous_questions,
+                    metrics=self.last_generation_metrics, start=start
+                )
+                if question:
+                    self._accept_generated(question)
+                else:
+                    question = self._fallback_question()
+                    self.last_source = 'bank'
+                if question is None:
+                    self.last_source = 'failed'
+                    return None
+
+        self._accept_question(question)
+        self._adopt_context(context)
+        self._schedule_prefetch(question)
+        return question
+
+    def stream_next_question(self, user_answer=None):
+        """
+        與 get_next_question 相同，但逐 token 產生 (event, data)：
+        token → 模型輸出片段、retry → 本次輸出不合格將重試、
+        validated → 通過驗證的最終題目（來源見 last_source）、error → 無法產生也沒有備用題目
+        """
+        self._record_answer(user_answer)
 
-        for i in range(10):
-            previous_titles = "\n".join(self.previous_questions)
-            raw_output = self.follow_up_chain.invoke({
-                "chat_history": self.memory.buffer,
-                "last_answer": user_answer,
-                "previous_titles": previous_titles
-            }).strip()
+        context = None
+        start = time.monotonic()
+        if self.step < len(self.initial_questions):
+            question = self.initial_questions[self.step]
+            self.last_source = 'initial'
+        else:
+            question, context = self._reuse_question(user_answer, start)
+        if question:
+            self._accept_question(question)
+            self._adopt_context(context)
+            self._schedule_prefetch(question)
+            yield 'token', question
+            yield 'validated', question
+            return
 
-            question = self.extract_question_block(raw_output)
+        prompt, context = self._follow_up_request(self.memory.messages, user_answer, self.previous_questions)
+        expired = False
+        for i in range(MAX_ATTEMPTS):
+            raw_output = ''
+            status = 'pending'
+            generation = self.backend.stream(prompt, context)
+            try:
+                for chunk in generation:
+                    raw_output += chunk
+                    yield 'token', chunk
+                    status = self.check_stream_format(raw_output)
+                    # 三行都收到就不必等模型把多餘的內容說完；確定不合格則提早放棄這次輸出
+                    if status != 'pending':
+                        break
+                    if self.deadline is not None and time.monotonic() - start > self.deadline:
+                        expired = True
+                        break
+            except QueueFull:
+                raise
+            except Exception as e:
+                print(f"⚠️ 第 {i+1} 次呼叫 LLM 失敗：{e}")
+                yield 'retry', {'attempt': i + 1, 'reason': 'error'}
+                continue
+            if expired:
+                break
 
+            question = self.extract_question_block(raw_output) if status != 'invalid' else None
             if question:
                 title = self.get_question_title(question)
-                if title not in self.previous_questions:
-                    self.previous_questions.add(title)
-                    self.memory.chat_memory.add_ai_message(question)
-                    return question
-                else:
-                    print(f"⚠️ 第 {i+1} 次問題重複：{title}")
+                if not self.is_repeated(question):
+                    self._accept_generated(question)
+                    self._accept_question(question)
+                    yield 'validated', question
+                    # 題目已送出；讀完剩餘輸出才拿得到 Ollama 最後回傳的 context
+                    if self.backend.supports_context:
+                        self._adopt_context(generation.drain().context)
+                    self._schedule_prefetch(question)
+                    return
+                print(f"⚠️ 第 {i+1} 次問題重複：{title}")
+                yield 'retry', {'attempt': i + 1, 'reason': 'duplicate'}
             else:
                 print(f"⚠️ 第 {i+1} 次輸出未通過格式驗證：\n{raw_output}\n")
+                yield 'retry', {'attempt': i + 1, 'reason': 'format'}
+            if self.deadline is not None and time.monotonic() - start > self.deadline:
+                break
 
-        return "⚠️ 抱歉，無法產生符合格式且不重複的問題。請稍後再試。"
+        question = self._fallback_question()
+        if question is None:
+            self.last_source = 'failed'
+            yield 'error', GENERATION_FAILED_MESSAGE
+            return
+        self.last_source = 'bank'
+        self._accept_question(question)
+        self._schedule_prefetch(question)
+        yield 'fallback', question
+        yield 'validated', question
+
+    def _discard_prefetch(self):
+        # 問卷已結束，不會再用到預取的下一題
+        if self.prefetcher is not None:
+            self.prefetcher.discard((self.session_id, self.step + 1))
+
+    def _summary_request(self):
+        messages = self.memory.messages
+        context = self._usable_context(messages)
+        if context:
+            new_messages = "\n".join(self.memory.format_lines(messages[self.context_messages:]))
+            return self.summary_continue_prompt.format(new_messages=new_messages), context
+        return self.summary_prompt.format(chat_history=self.memory.render()), None
+
+    def _local_recommendation(self):
+        """回傳 (作答路徑, 本機推薦)；沒有夠相近的已完成問卷時推薦為 None"""
+        if self.recommender is None:
+            return None, None
+        path = self.answer_path(self.memory.messages)
+        return path, self.recommender.recommend(path)
+
+    def _learn_recommendation(self, path, recommendation):
+        if self.recommender is not None:
+            self.recommender.add(path, recommendation.strip())
 
     def summarize_recommendation(self):
-        return self.summary_chain.invoke({
-            "chat_history": self.memory.buffer
-        })
+        self._discard_prefetch()
+        self.memory.release(self.session_id)
+        path, recommendation = self._local_recommendation()
+        if recommendation is not None:
+            self.last_source = 'local'
+            return recommendation
+        recommendation = self.backend.invoke(*self._summary_request()).text
+        self.last_source = 'llm'
+        self._learn_recommendation(path, recommendation)
+        return recommendation
+
+    def stream_recommendation(self):
+        self._discard_prefetch()
+        self.memory.release(self.session_id)
+        path, recommendation = self._local_recommendation()
+        if recommendation is not None:
+            self.last_source = 'local'
+            yield recommendation
+            return
+        self.last_source = 'llm'
+        generation = self.backend.stream(*self._summary_request())
+        for chunk in generation:
+            yield chunk
+        self._learn_recommendation(path, generation.text)
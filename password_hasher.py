@@ -0,0 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasher:
+    """
+    在獨立的 process pool 中計算密碼雜湊，避免登入尖峰時佔住處理請求的執行緒與 GIL。
+    同時送進 pool 的工作不超過 max_workers + max_pending 件，超過時呼叫端等待，不會無限排隊。
+    method 為 werkzeug 的雜湊設定（例如 scrypt:32768:8:1、pbkdf2:sha256:600000）；
+    既有雜湊的設定與目前不同時 needs_rehash 回傳 True，讓登入成功時換成新設定。
+    max_workers 為 0 時直接在呼叫端的執行緒計算。
+    """
+
+    def __init__(self, method="scrypt", salt_length=16, max_workers=None, max_pending=None):
+        self.method = method
+        self.salt_length = salt_length
+        self.max_workers = multiprocessing.cpu_count() if max_workers is None else max_workers
+        # 依實際產生的雜湊取得完整設定，例如 scrypt 會展開為 scrypt:32768:8:1
+        self.prefix = generate_password_hash("", method, salt_length).split("$", 1)[0]
+        pending = self.max_workers if max_pending is None else max_pending
+        self._slots = threading.BoundedSemaphore(self.max_workers + pending) if self.max_workers else None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn 不會複製整個 Flask process（含執行緒與連線），子 process 只需要 werkzeug
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self.max_workers:
+            return fn(*args)
+        with self._slots:
+            return self._get_pool().submit(fn, *args).result()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split("$", 1)[0] != self.prefix
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def get_password_hasher():
+    hasher = current_app.extensions.get('password_hasher')
+    if hasher is None:
+        config = current_app.config
+        hasher = PasswordHasher(
+            method=config['PASSWORD_HASH_METHOD'],
+            salt_length=config['PASSWORD_HASH_SALT_LENGTH'],
+            max_workers=config['PASSWORD_HASH_WORKERS'],
+            max_pending=config['PASSWORD_HASH_MAX_PENDING']
+        )
+        current_app.extensions['password_hasher'] = hasher
+    return hasher
@@ -0,0 +1,99 @@
+from functools import lru_cache
+import re
+import threading
+import zlib
+
+import numpy as np
+
+_PRIME = np.uint64(4294967311)  # 大於 2^32 的質數，a * x + b 不會溢位 uint64
+_PUNCTUATION = re.compile(r"[\s\W_]+")
+
+
+def normalize_title(title):
+    """去掉「問題：」前綴、空白與標點，只留下用來比對的文字"""
+    title = title.strip()
+    if title.startswith("問題："):
+        title = title[len("問題："):]
+    return _PUNCTUATION.sub("", title).lower()
+
+
+def shingles(text, ngram=2):
+    """字元 n-gram；中文不需斷詞即可比較"""
+    if len(text) <= ngram:
+        return {text} if text else set()
+    return {text[i:i + ngram] for i in range(len(text) - ngram + 1)}
+
+
+@lru_cache(maxsize=None)
+def _hash_params(num_perm, seed):
+    """MinHash 的雜湊參數；相同設定的索引共用同一組唯讀陣列"""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    a.flags.writeable = False
+    b.flags.writeable = False
+    return a, b
+
+
+class QuestionIndex:
+    """
+    以字元 n-gram 的 MinHash 簽章比對題目是否語意重複。
+    簽章存在一個 NumPy 矩陣中，查詢時一次與所有題目比較，估計的 Jaccard 相似度達 threshold 即視為重複。
+    """
+
+    def __init__(self, threshold=0.6, num_perm=128, ngram=2, seed=1):
+        self.threshold = threshold
+        self.ngram = ngram
+        self._a, self._b = _hash_params(num_perm, seed)
+        self._signatures = np.empty((16, num_perm), dtype=np.uint64)
+        self.titles = []
+        self._normalized = {}  # 正規化後的題目 -> 在 titles 中的位置
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_titles(cls, titles, **kwargs):
+        index = cls(**kwargs)
+        for title in titles:
+            index.add(title)
+        return index
+
+    def __len__(self):
+        return len(self.titles)
+
+    def signature(self, title):
+        grams = shingles(normalize_title(title), self.ngram)
+        if not grams:
+            return np.full(len(self._a), _PRIME, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def add(self, title):
+        key = normalize_title(title)
+        signature = self.signature(title)
+        with self._lock:
+            if key in self._normalized:
+                return
+            n = len(self.titles)
+            if n == len(self._signatures):
+                self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+            self._signatures[n] = signature
+            self._normalized[key] = n
+            self.titles.append(title)
+
+    def most_similar(self, title):
+        """回傳 (最相近的題目, 估計相似度)；索引為空時回傳 (None, 0.0)"""
+        key = normalize_title(title)
+        signature = self.signature(title)
+        with self._lock:
+            if key in self._normalized:
+                return self.titles[self._normalized[key]], 1.0
+            n = len(self.titles)
+            if n == 0:
+                return None, 0.0
+            scores = (self._signatures[:n] == signature).mean(axis=1)
+            best = int(scores.argmax())
+            return self.titles[best], float(scores[best])
+
+    def is_duplicate(self, title):
+        match, score = self.most_similar(title)
+        return match is not None and score >= self.threshold
@@ -0,0 +1,50 @@
+from collections import deque
+import json
+import os
+import random
+import threading
+
+from ollama_agent import extract_question_block
+
+DEFAULT_BANK_PATH = os.path.join(os.path.dirname(__file__), 'question_bank.json')
+
+
+class QuestionBank:
+    """
+    LLM 來不及產生題目時的備用題庫：
+    人工整理的題目（JSON 檔）加上先前 LLM 產生、已通過格式驗證的題目。
+    只收 extract_question_block 驗證過的題目；題目取出時會避開使用者已經被問過（或語意相近）的題目。
+    """
+
+    def __init__(self, path=DEFAULT_BANK_PATH, max_generated=500):
+        self.curated = []
+        self.generated = deque(maxlen=max_generated)
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for question in json.load(f):
+                    question = extract_question_block(question)
+                    if question:
+                        self.curated.append(question)
+
+    def add(self, text):
+        """收錄 LLM 產生的題目；格式不符或已存在時略過"""
+        question = extract_question_block(text or '')
+        if not question:
+            return
+        with self._lock:
+            if question not in self.generated and question not in self.curated:
+                self.generated.append(question)
+
+    def __len__(self):
+        return len(self.curated) + len(self.generated)
+
+    def pick(self, title_index):
+        """隨機挑一題與已問過題目都不重複的；沒有可用題目時回傳 None"""
+        with self._lock:
+            candidates = self.curated + list(self.generated)
+        random.shuffle(candidates)
+        for question in candidates:
+            if not title_index.is_duplicate(question.split('\n')[0]):
+                return question
+        return None
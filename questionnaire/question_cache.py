@@ -0,0 +1,103 @@
+from collections import OrderedDict
+import atexit
+import json
+import os
+import random
+import threading
+import time
+
+
+class QuestionCache:
+    """
+    以正規化的作答路徑（每一題的題目與所選選項）為 key 快取下一題。
+    依筆數（LRU）與存活時間淘汰；freshness 比例的查詢會刻意略過快取，讓 LLM 持續產生新題目。
+    設定 path 時會從 JSON 檔載入，並在程式結束時寫回。
+    """
+
+    def __init__(self, max_entries=5000, max_age=86400, freshness=0.1, path=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.freshness = freshness
+        self.path = path
+        self._entries = OrderedDict()  # key -> (建立時間, 題目)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def make_key(path):
+        return json.dumps(path, ensure_ascii=False)
+
+    def _expired(self, created_at):
+        return time.time() - created_at > self.max_age
+
+    def peek(self, key):
+        """查詢但不計入統計、也不套用 freshness"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0]):
+                return None
+            return entry[1]
+
+    def get(self, key):
+        if self.freshness and random.random() < self.freshness:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, question):
+        with self._lock:
+            self._entries[key] = (time.time(), question)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "size": len(self._entries)
+            }
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            entries = json.load(f)
+        with self._lock:
+            for key, created_at, question in entries:
+                if not self._expired(created_at):
+                    self._entries[key] = (created_at, question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        with self._lock:
+            entries = [
+                [key, created_at, question]
+                for key, (created_at, question) in self._entries.items()
+                if not self._expired(created_at)
+            ]
+        # 先寫暫存檔再置換，避免多個 worker 同時寫入時留下半個檔案
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
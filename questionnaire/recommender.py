@@ -0,0 +1,116 @@
+import atexit
+import json
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from question_index import normalize_title, shingles
+
+
+class ActivityRecommender:
+    """
+    以過去完成的問卷做最近鄰推薦：每份問卷的作答路徑（題目, 所選選項）經 feature hashing 轉成單位向量，
+    與所有已知問卷一次算出 cosine 相似度。最相近的一份達 threshold 時直接沿用它的推薦，
+    否則交給 LLM，並把 LLM 的推薦收進索引。
+    超過 max_entries 時覆蓋最舊的一筆；設定 path 時會從 JSON 檔載入，並在程式結束時寫回。
+    """
+
+    def __init__(self, dim=512, threshold=0.9, max_entries=5000, path=None):
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self._vectors = np.zeros((min(64, max_entries), dim), dtype=np.float32)
+        self._entries = []  # [作答路徑, 推薦內容]，與 _vectors 的列對應
+        self._next = 0  # 滿了之後下一筆要覆蓋的位置
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def vectorize(self, path):
+        """
+        每一題貢獻相同權重：題目的字元 bigram 各自與所選選項組合後 hash 到向量的某一維；
+        選項本身也算一個特徵，讓措辭不同但選擇相同的問卷仍然相近
+        """
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for title, option in path:
+            grams = shingles(normalize_title(title))
+            for gram in grams:
+                vector[zlib.crc32(f"{gram}\x1f{option}".encode("utf-8")) % self.dim] += 1.0 / len(grams)
+            vector[zlib.crc32(f"\x1e{option}".encode("utf-8")) % self.dim] += 0.5
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def __len__(self):
+        return len(self._entries)
+
+    def most_similar(self, path):
+        """回傳 (推薦內容, 相似度)；索引為空時回傳 (None, 0.0)"""
+        vector = self.vectorize(path)
+        with self._lock:
+            n = len(self._entries)
+            if n == 0:
+                return None, 0.0
+            scores = self._vectors[:n] @ vector
+            best = int(scores.argmax())
+            return self._entries[best][1], float(scores[best])
+
+    def recommend(self, path):
+        """有夠相近的問卷時回傳它的推薦，否則回傳 None"""
+        recommendation, score = self.most_similar(path)
+        confident = recommendation is not None and score >= self.threshold
+        with self._lock:
+            if confident:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return recommendation if confident else None
+
+    def add(self, path, recommendation):
+        if not path or not recommendation:
+            return
+        vector = self.vectorize(path)
+        with self._lock:
+            n = len(self._entries)
+            if n < self.max_entries:
+                if n == len(self._vectors):
+                    grown = min(2 * n, self.max_entries)
+                    self._vectors = np.concatenate([self._vectors, np.zeros((grown - n, self.dim), dtype=np.float32)])
+                self._vectors[n] = vector
+                self._entries.append([path, recommendation])
+            else:
+                self._vectors[self._next] = vector
+                self._entries[self._next] = [path, recommendation]
+                self._next = (self._next + 1) % self.max_entries
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries)
+            }
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            entries = json.load(f)
+        # 只保留最新的 max_entries 筆；向量依目前的設定重新計算
+        for path, recommendation in entries[-self.max_entries:]:
+            self.add(path, recommendation)
+
+    def save(self):
+        with self._lock:
+            # 依新舊順序輸出，載入時才能保留最新的
+            entries = self._entries[self._next:] + self._entries[:self._next]
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
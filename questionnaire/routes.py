@@ -1,9 +1,193 @@
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
 from . import questionnaire_bp
-from ollama_agent import OllamaMultiTurnAgent
+from .session_store import get_session_store
+from .question_cache import QuestionCache
+from .question_bank import QuestionBank, DEFAULT_BANK_PATH
+from .recommender import ActivityRecommender
+from .transcript_writer import TranscriptWriter
+from models import QuestionnaireTurn, QuestionnaireRecommendation
+from ollama_agent import OllamaMultiTurnAgent, QuestionPrefetcher, GENERATION_FAILED_MESSAGE
+from llm_backend import backend_from_config
+from llm_dispatcher import LLMDispatcher, QueueFull
+from auth.admin_session import admin_required
 
-agent_session = {}
+def _get_prefetcher():
+    if not current_app.config['QUESTIONNAIRE_PREFETCH']:
+        return None
+    prefetcher = current_app.extensions.get('questionnaire_prefetcher')
+    if prefetcher is None:
+        prefetcher = QuestionPrefetcher(max_workers=current_app.config['QUESTIONNAIRE_PREFETCH_WORKERS'])
+        current_app.extensions['questionnaire_prefetcher'] = prefetcher
+    return prefetcher
+
+def _get_question_cache():
+    config = current_app.config
+    if not config['QUESTION_CACHE']:
+        return None
+    cache = current_app.extensions.get('question_cache')
+    if cache is None:
+        cache = QuestionCache(
+            max_entries=config['QUESTION_CACHE_MAX'],
+            max_age=config['QUESTION_CACHE_MAX_AGE'],
+            freshness=config['QUESTION_CACHE_FRESHNESS'],
+            path=config['QUESTION_CACHE_PATH']
+        )
+        current_app.extensions['question_cache'] = cache
+    return cache
+
+def _get_question_bank():
+    config = current_app.config
+    if not config['QUESTION_BANK']:
+        return None
+    bank = current_app.extensions.get('question_bank')
+    if bank is None:
+        bank = QuestionBank(
+            path=config['QUESTION_BANK_PATH'] or DEFAULT_BANK_PATH,
+            max_generated=config['QUESTION_BANK_MAX']
+        )
+        current_app.extensions['question_bank'] = bank
+    return bank
+
+def _get_recommender():
+    config = current_app.config
+    if not config['RECOMMENDER']:
+        return None
+    recommender = current_app.extensions.get('activity_recommender')
+    if recommender is None:
+        recommender = ActivityRecommender(
+            threshold=config['RECOMMENDER_THRESHOLD'],
+            max_entries=config['RECOMMENDER_MAX'],
+            path=config['RECOMMENDER_PATH']
+        )
+        if config['QUESTIONNAIRE_TRANSCRIPTS'] and not config['RECOMMENDER_PATH']:
+            # 從資料庫中過去由 LLM 產生的推薦建立索引，重啟後不必重新累積
+            rows = QuestionnaireRecommendation.query \
+                .filter_by(source='llm') \
+                .order_by(QuestionnaireRecommendation.id.desc()) \
+                .limit(config['RECOMMENDER_MAX']) \
+                .all()
+            for row in reversed(rows):
+                recommender.add(row.answers, row.recommendation)
+        current_app.extensions['activity_recommender'] = recommender
+    return recommender
+
+def _get_transcript_writer():
+    config = current_app.config
+    if not config['QUESTIONNAIRE_TRANSCRIPTS']:
+        return None
+    writer = current_app.extensions.get('transcript_writer')
+    if writer is None:
+        writer = TranscriptWriter(
+            current_app._get_current_object(),
+            batch_size=config['TRANSCRIPT_BATCH_SIZE'],
+            flush_interval=config['TRANSCRIPT_FLUSH_INTERVAL'],
+            max_buffer=config['TRANSCRIPT_MAX_BUFFER']
+        )
+        current_app.extensions['transcript_writer'] = writer
+    return writer
+
+def _record_turn(user_id, agent, answer, question):
+    writer = _get_transcript_writer()
+    if writer is not None:
+        writer.submit(
+            QuestionnaireTurn,
+            user_id=int(user_id),
+            session_id=agent.session_id,
+            step=agent.step,
+            answer=answer,
+            question=question,
+            source=agent.last_source,
+            created_at=datetime.utcnow()
+        )
+
+def _record_recommendation(user_id, agent, recommendation):
+    writer = _get_transcript_writer()
+    if writer is not None:
+        writer.submit(
+            QuestionnaireRecommendation,
+            user_id=int(user_id),
+            session_id=agent.session_id,
+            answers=agent.answer_path(agent.memory.messages),
+            recommendation=recommendation,
+            source=agent.last_source,
+            created_at=datetime.utcnow()
+        )
+
+def _get_candidate_pool():
+    # 平行候選與逾時控制都需要在背景執行 LLM 呼叫
+    if current_app.config['QUESTION_CANDIDATES'] <= 1 and current_app.config['QUESTION_DEADLINE'] is None:
+        return None
+    pool = current_app.extensions.get('question_candidate_pool')
+    if pool is None:
+        pool = ThreadPoolExecutor(
+            max_workers=current_app.config['QUESTION_CANDIDATE_WORKERS'],
+            thread_name_prefix='question-candidate'
+        )
+        current_app.extensions['question_candidate_pool'] = pool
+    return pool
+
+def _get_llm_backend():
+    backend = current_app.extensions.get('llm_backend')
+    if backend is None:
+        backend = backend_from_config(current_app.config)
+        current_app.extensions['llm_backend'] = backend
+    return backend
+
+def _get_llm_dispatcher():
+    dispatcher = current_app.extensions.get('llm_dispatcher')
+    if dispatcher is None:
+        config = current_app.config
+        dispatcher = LLMDispatcher(
+            max_concurrency=config['LLM_MAX_CONCURRENCY'],
+            max_queue=config['LLM_MAX_QUEUE'],
+            queue_timeout=config['LLM_QUEUE_TIMEOUT'],
+            speculative_queue=config['LLM_SPECULATIVE_QUEUE']
+        )
+        current_app.extensions['llm_dispatcher'] = dispatcher
+    return dispatcher
+
+def _new_agent(user_id, state=None):
+    dispatcher = _get_llm_dispatcher()
+    options = {
+        # 同一位使用者的所有 LLM 呼叫都依使用者輪流排隊；預取與額外的平行候選排在即時請求之後
+        'backend': dispatcher.wrap(_get_llm_backend(), user_key=user_id),
+        'speculative_backend': dispatcher.wrap(_get_llm_backend(), user_key=user_id, speculative=True),
+        'prefetcher': _get_prefetcher(),
+        'question_cache': _get_question_cache(),
+        'candidate_pool': _get_candidate_pool(),
+        'candidates': current_app.config['QUESTION_CANDIDATES'],
+        'deadline': current_app.config['QUESTION_DEADLINE'],
+        'memory_strategy': current_app.config['QUESTIONNAIRE_MEMORY'],
+        'memory_tokens': current_app.config['QUESTIONNAIRE_MEMORY_TOKENS'],
+        'duplicate_threshold': current_app.config['QUESTION_DUPLICATE_THRESHOLD'],
+        'question_bank': _get_question_bank(),
+        'recommender': _get_recommender()
+    }
+    if state is None:
+        return OllamaMultiTurnAgent(**options)
+    return OllamaMultiTurnAgent.from_state(state, **options)
+
+@questionnaire_bp.errorhandler(QueueFull)
+def handle_queue_full(e):
+    response = jsonify({'msg': str(e), 'retry_after': e.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        # 避免反向代理緩衝，讓第一個 token 能立即送達客戶端
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @questionnaire_bp.route('/start', methods=['POST'])
 @jwt_required()
@@ -24,11 +208,16 @@ def start_questionnaire():
             question:
               type: string
               example: 您最近偏好在室內還是戶外活動？
+            source:
+              type: string
+              example: initial
     """
     user_id = get_jwt_identity()
-    agent_session[user_id] = OllamaMultiTurnAgent()
-    first_question = agent_session[user_id].get_next_question()
-    return jsonify({'question': first_question})
+    agent = _new_agent(user_id)
+    first_question = agent.get_next_question()
+    get_session_store().set(user_id, agent.to_state())
+    _record_turn(user_id, agent, None, first_question)
+    return jsonify({'question': first_question, 'source': agent.last_source})
 
 @questionnaire_bp.route('/next', methods=['POST'])
 @jwt_required()
@@ -60,14 +249,98 @@ def next_question():
           properties:
             question:
               type: string
+            source:
+              type: string
+              description: 題目來源：initial、cache、prefetch、llm 或 bank（LLM 逾時或失敗時的備用題庫）
+              example: llm
+            metrics:
+              type: object
+              description: 此題嘗試由 LLM 即時產生時的統計（候選數、浪費數、勝出延遲）
+      503:
+        description: LLM 無法產生題目且備用題庫沒有可用的題目，或 LLM 佇列已滿（附 Retry-After 標頭）
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    store = get_session_store()
+    state = store.get(user_id)
+    if state is None:
+        return jsonify({'msg': '請先啟動問卷流程'}), 400
+    answer = data.get('answer', '')
+    agent = _new_agent(user_id, state)
+    question = agent.get_next_question(user_answer=answer)
+    if question is None:
+        # 不保存狀態，讓使用者可以用同一個回答重試
+        return jsonify({'msg': GENERATION_FAILED_MESSAGE}), 503
+    store.set(user_id, agent.to_state())
+    _record_turn(user_id, agent, answer, question)
+    result = {'question': question, 'source': agent.last_source}
+    if agent.last_generation_metrics:
+        result['metrics'] = agent.last_generation_metrics
+    return jsonify(result)
+
+@questionnaire_bp.route('/next/stream', methods=['POST'])
+@jwt_required()
+def next_question_stream():
+    """
+    回答一題後以 Server-Sent Events 串流取得下一題 (需要 JWT)
+    ---
+    tags:
+      - Questionnaire
+    security:
+      - Bearer: []
+    consumes:
+      - application/json
+    produces:
+      - text/event-stream
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            answer:
+              type: string
+              example: 我喜歡安靜的室內空間
+    responses:
+      200:
+        description: |
+          SSE 事件串流：
+          token（模型輸出片段）、retry（格式不符或重複，重新產生）、
+          fallback（逾時或失敗，改用備用題庫的題目）、
+          validated（通過驗證的最終題目與來源）、error（無法產生題目或 LLM 佇列已滿）
+      503:
+        description: LLM 佇列已滿，依 Retry-After 標頭的秒數後重試
     """
     user_id = get_jwt_identity()
     data = request.get_json()
-    if user_id not in agent_session:
+    store = get_session_store()
+    state = store.get(user_id)
+    if state is None:
         return jsonify({'msg': '請先啟動問卷流程'}), 400
+    # 串流開始後就無法再改狀態碼，佇列已滿時在開始前就回 503
+    _get_llm_dispatcher().check_admission()
     answer = data.get('answer', '')
-    question = agent_session[user_id].get_next_question(user_answer=answer)
-    return jsonify({'question': question})
+    agent = _new_agent(user_id, state)
+
+    def events():
+        accepted = None
+        try:
+            for event, payload in agent.stream_next_question(user_answer=answer):
+                if event == 'validated':
+                    accepted = payload
+                    yield _sse(event, {'question': payload, 'source': agent.last_source})
+                else:
+                    yield _sse(event, payload)
+        except QueueFull as e:
+            yield _sse('error', str(e))
+            return
+        # agent 在送出 validated 後可能還會更新 Ollama context，結束後才保存
+        if accepted:
+            store.set(user_id, agent.to_state())
+            _record_turn(user_id, agent, answer, accepted)
+
+    return _sse_response(events())
 
 @questionnaire_bp.route('/summary', methods=['GET'])
 @jwt_required()
@@ -88,10 +361,88 @@ def summarize_questionnaire():
             recommendation:
               type: string
               example: 我建議你選擇閱讀，因為你喜歡靜態、室內且時間有限的活動。
+            source:
+              type: string
+              description: local（沿用相近問卷的推薦）或 llm
+              example: local
+      503:
+        description: LLM 佇列已滿，依 Retry-After 標頭的秒數後重試
+    """
+    user_id = get_jwt_identity()
+    store = get_session_store()
+    state = store.get(user_id)
+    if state is None:
+        return jsonify({'msg': '尚未開始問卷'}), 400
+    agent = _new_agent(user_id, state)
+    summary = agent.summarize_recommendation()
+    store.delete(user_id)
+    _record_recommendation(user_id, agent, summary)
+    return jsonify({'recommendation': summary, 'source': agent.last_source})
+
+@questionnaire_bp.route('/summary/stream', methods=['GET'])
+@jwt_required()
+def summarize_questionnaire_stream():
+    """
+    完成問卷後以 Server-Sent Events 串流產出活動推薦 (需要 JWT)
+    ---
+    tags:
+      - Questionnaire
+    security:
+      - Bearer: []
+    produces:
+      - text/event-stream
+    responses:
+      200:
+        description: SSE 事件串流：token（推薦內容片段）、done（完整推薦內容與來源）、error（LLM 佇列已滿）
+      503:
+        description: LLM 佇列已滿，依 Retry-After 標頭的秒數後重試
     """
     user_id = get_jwt_identity()
-    if user_id not in agent_session:
+    store = get_session_store()
+    state = store.get(user_id)
+    if state is None:
         return jsonify({'msg': '尚未開始問卷'}), 400
-    summary = agent_session[user_id].summarize_recommendation()
-    del agent_session[user_id]
-    return jsonify({'recommendation': summary})
\ No newline at end of file
+    # 串流開始後就無法再改狀態碼，佇列已滿時在開始前就回 503
+    _get_llm_dispatcher().check_admission()
+    agent = _new_agent(user_id, state)
+
+    def events():
+        summary = ''
+        try:
+            for chunk in agent.stream_recommendation():
+                summary += chunk
+                yield _sse('token', chunk)
+        except QueueFull as e:
+            yield _sse('error', str(e))
+            return
+        store.delete(user_id)
+        _record_recommendation(user_id, agent, summary)
+        yield _sse('done', {'recommendation': summary, 'source': agent.last_source})
+
+    return _sse_response(events())
+
+@questionnaire_bp.route('/stats', methods=['GET'])
+@admin_required
+def questionnaire_stats():
+    """
+    LLM 排隊、題目重用與本機推薦的統計 (需要先由 /admin/login 登入後台)
+    ---
+    tags:
+      - Questionnaire
+    responses:
+      200:
+        description: llm（執行中與排隊數、等待時間、拒絕數）、prefetch、cache、recommender、transcripts（背景寫入的待寫、已寫與丟棄筆數）
+      403:
+        description: 不是已登入的管理員
+    """
+    prefetcher = _get_prefetcher()
+    cache = _get_question_cache()
+    recommender = _get_recommender()
+    writer = _get_transcript_writer()
+    return jsonify({
+        'llm': _get_llm_dispatcher().stats(),
+        'prefetch': prefetcher.stats() if prefetcher else None,
+        'cache': cache.stats() if cache else None,
+        'recommender': recommender.stats() if recommender else None,
+        'transcripts': writer.stats() if writer else None
+    })
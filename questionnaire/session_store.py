@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import threading
+import time
+
+from flask import current_app
+from extensions import db
+from models import QuestionnaireSession
+from ollama_agent import QuestionnaireState
+
+
+class MemorySessionStore:
+    """單一 process 內的問卷狀態（直接保存 QuestionnaireState），依 LRU 與 TTL 淘汰"""
+
+    def __init__(self, max_sessions=1000, ttl=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # user_id -> (更新時間, state)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            updated_at, state = entry
+            if time.monotonic() - updated_at > self.ttl:
+                del self._sessions[user_id]
+                return None
+            self._sessions.move_to_end(user_id)
+            return state
+
+    def set(self, user_id, state):
+        with self._lock:
+            self._sessions[user_id] = (time.monotonic(), state)
+            self._sessions.move_to_end(user_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+
+class SQLAlchemySessionStore:
+    """存在資料庫的問卷狀態，任何 worker 都能接手同一位使用者的問卷"""
+
+    def __init__(self, max_sessions=1000, ttl=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+
+    def _cutoff(self):
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def get(self, user_id):
+        record = db.session.get(QuestionnaireSession, int(user_id))
+        if record is None:
+            return None
+        if record.updated_at < self._cutoff():
+            db.session.delete(record)
+            db.session.commit()
+            return None
+        return QuestionnaireState.from_dict(record.state)
+
+    def set(self, user_id, state):
+        record = db.session.get(QuestionnaireSession, int(user_id))
+        if record is None:
+            record = QuestionnaireSession(user_id=int(user_id))
+            db.session.add(record)
+        record.state = state.to_dict()
+        record.updated_at = datetime.utcnow()
+        self._evict()
+        db.session.commit()
+
+    def delete(self, user_id):
+        QuestionnaireSession.query.filter_by(user_id=int(user_id)).delete()
+        db.session.commit()
+
+    def _evict(self):
+        # 先清掉過期的，再依最久未更新的順序刪到上限以內
+        QuestionnaireSession.query.filter(
+            QuestionnaireSession.updated_at < self._cutoff()
+        ).delete(synchronize_session=False)
+        overflow = QuestionnaireSession.query.count() - self.max_sessions
+        if overflow > 0:
+            oldest = db.session.query(QuestionnaireSession.user_id) \
+                .order_by(QuestionnaireSession.updated_at) \
+                .limit(overflow) \
+                .subquery()
+            QuestionnaireSession.query.filter(
+                QuestionnaireSession.user_id.in_(db.select(oldest.c.user_id))
+            ).delete(synchronize_session=False)
+
+
+SESSION_BACKENDS = {
+    'memory': MemorySessionStore,
+    'db': SQLAlchemySessionStore,
+}
+
+
+def get_session_store():
+    store = current_app.extensions.get('questionnaire_session_store')
+    if store is None:
+        config = current_app.config
+        backend = SESSION_BACKENDS[config['QUESTIONNAIRE_SESSION_BACKEND']]
+        store = backend(
+            max_sessions=config['QUESTIONNAIRE_SESSION_MAX'],
+            ttl=config['QUESTIONNAIRE_SESSION_TTL']
+        )
+        current_app.extensions['questionnaire_session_store'] = store
+    return store
@@ -0,0 +1,92 @@
+from collections import deque
+import atexit
+import threading
+
+from extensions import db
+
+
+class TranscriptWriter:
+    """
+    在背景批次寫入問卷紀錄，請求本身只把資料放進緩衝區。
+    緩衝區累積 batch_size 筆或距上次寫入超過 flush_interval 秒時，依資料表分組以 executemany 一次寫入。
+    緩衝區上限為 max_buffer 筆，資料庫跟不上時丟棄最舊的紀錄（計入 dropped），不拖慢請求；
+    程式結束時會把剩下的紀錄寫完。
+    """
+
+    def __init__(self, app, batch_size=100, flush_interval=2.0, max_buffer=10000):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=max_buffer)  # (Model, 欄位 dict)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, model, **row):
+        if self._closed:
+            return
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append((model, row))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return
+                rows = list(self._buffer)
+                self._buffer.clear()
+            grouped = {}
+            for model, row in rows:
+                grouped.setdefault(model, []).append(row)
+            with self.app.app_context():
+                try:
+                    for model, batch in grouped.items():
+                        db.session.execute(db.insert(model), batch)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    self.failed += len(rows)
+                    print(f"⚠️ 問卷紀錄寫入失敗（{len(rows)} 筆）：{e}")
+                    return
+                finally:
+                    db.session.remove()
+            self.written += len(rows)
+            self.batches += 1
+
+    def close(self, timeout=10):
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._buffer)
+        return {
+            "pending": pending,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
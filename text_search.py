@@ -0,0 +1,67 @@
+"""
+日記全文檢索的斷詞：中文不需字典，連續的漢字切成單字與相鄰兩字（bigram），英文與數字以整個字為單位。
+寫入時把結果以空白串接存進 mood_logs.search_terms，由 PostgreSQL 的 GIN 索引或 SQLite FTS5 建立索引。
+"""
+import re
+
+from markupsafe import escape
+
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'  # 假名與漢字
+_RUNS = re.compile(rf'[{_CJK}]+|[^\W_{_CJK}]+')
+
+
+def _is_cjk(run):
+    return '\u3040' <= run[0] <= '\ufaff'
+
+
+def tokenize(text, unigrams=True):
+    for run in _RUNS.findall((text or '').lower()):
+        if not _is_cjk(run):
+            yield run
+            continue
+        if unigrams or len(run) == 1:
+            yield from run
+        for i in range(len(run) - 1):
+            yield run[i:i + 2]
+
+
+def diary_terms(text):
+    """要寫入索引的詞，重複出現的詞保留，讓排名反映出現次數"""
+    return ' '.join(tokenize(text))
+
+
+def query_terms(query):
+    """查詢用的詞（全部都要出現）；兩字以上的中文只用 bigram，單一個字才用單字"""
+    return list(dict.fromkeys(tokenize(query, unigrams=False)))
+
+
+def make_snippet(text, terms, width=60):
+    """取第一個命中的詞附近約 width 個字，命中的部分以 <mark> 標示（其餘內容已跳脫）"""
+    text = text or ''
+    lowered = text.lower()
+    marked = [False] * len(text)
+    first = len(text)
+    for term in terms:
+        start = lowered.find(term)
+        if start != -1:
+            first = min(first, start)
+        while start != -1:
+            marked[start:start + len(term)] = [True] * len(term)
+            start = lowered.find(term, start + 1)
+    if first == len(text):
+        first = 0
+    begin = max(0, min(first - width // 3, len(text) - width))
+    end = min(len(text), begin + width)
+
+    parts = ['…'] if begin > 0 else []
+    i = begin
+    while i < end:
+        j = i
+        while j < end and marked[j] == marked[i]:
+            j += 1
+        chunk = str(escape(text[i:j]))
+        parts.append(f'<mark>{chunk}</mark>' if marked[i] else chunk)
+        i = j
+    if end < len(text):
+        parts.append('…')
+    return ''.join(parts)
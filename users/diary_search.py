@@ -0,0 +1,110 @@
+"""
+日記全文檢索。search_terms 由寫入時的斷詞產生（text_search.diary_terms）：
+PostgreSQL 以 to_tsvector('simple', search_terms) 的 GIN 索引查詢並以 ts_rank 排序；
+SQLite 以 FTS5 external content 表 mood_logs_fts 查詢並以 bm25 排序，由 trigger 隨 mood_logs 更新。
+"""
+import threading
+
+from sqlalchemy import event
+
+from extensions import db
+from models import MoodLog, MOOD_LOG_SEARCH_VECTOR
+from text_search import query_terms
+
+SQLITE_FTS_TABLE = 'mood_logs_fts'
+
+SQLITE_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5("
+    "search_terms, content='mood_logs', content_rowid='id', tokenize='unicode61')",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ai AFTER INSERT ON mood_logs BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, search_terms) VALUES (new.id, new.search_terms);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ad AFTER DELETE ON mood_logs BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, search_terms) VALUES ('delete', old.id, old.search_terms);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_au AFTER UPDATE OF search_terms ON mood_logs BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, search_terms) VALUES ('delete', old.id, old.search_terms);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, search_terms) VALUES (new.id, new.search_terms);
+    END""",
+)
+
+_installed = set()
+_install_lock = threading.Lock()
+
+
+def install_sqlite_fts(connection):
+    """建立 FTS5 表與 trigger；表是新建立的時候依 mood_logs 既有的紀錄重建索引"""
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SQLITE_FTS_TABLE,)
+    ).first()
+    for statement in SQLITE_FTS_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        connection.exec_driver_sql(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
+
+
+@event.listens_for(MoodLog.__table__, 'after_create')
+def _create_sqlite_fts(target, connection, **kwargs):
+    # 本機以 create_all 建立 mood_logs 時一併建立
+    if connection.dialect.name == 'sqlite':
+        install_sqlite_fts(connection)
+
+
+def _ensure_sqlite_fts():
+    # 資料庫是在此功能之前建立的，第一次查詢時補建
+    engine = db.engine
+    if engine.url in _installed:
+        return
+    with _install_lock:
+        if engine.url not in _installed:
+            with engine.begin() as connection:
+                install_sqlite_fts(connection)
+            _installed.add(engine.url)
+
+
+def _search_postgres(user_id, terms, limit, offset):
+    vector = db.literal_column(MOOD_LOG_SEARCH_VECTOR)
+    query = db.func.plainto_tsquery(db.literal_column("'simple'"), ' '.join(terms))
+    score = db.func.ts_rank(vector, query)
+    return db.session.query(MoodLog.date, MoodLog.mood, MoodLog.diary, score) \
+        .filter(MoodLog.user_id == user_id, MoodLog.deleted_at.is_(None), vector.op('@@')(query)) \
+        .order_by(score.desc(), MoodLog.date.desc()) \
+        .limit(limit).offset(offset).all()
+
+
+def _search_sqlite(user_id, terms, limit, offset):
+    _ensure_sqlite_fts()
+    match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+    rows = db.session.execute(db.text(f"""
+        SELECT m.date, m.mood, m.diary, -bm25({SQLITE_FTS_TABLE}) AS score
+        FROM {SQLITE_FTS_TABLE} JOIN mood_logs AS m ON m.id = {SQLITE_FTS_TABLE}.rowid
+        WHERE {SQLITE_FTS_TABLE} MATCH :match AND m.user_id = :user_id AND m.deleted_at IS NULL
+        ORDER BY score DESC, m.date DESC
+        LIMIT :limit OFFSET :offset
+    """).columns(MoodLog.date, MoodLog.mood, MoodLog.diary, db.column('score', db.Float)),
+        {'match': match, 'user_id': user_id, 'limit': limit, 'offset': offset})
+    return rows.all()
+
+
+def _search_like(user_id, terms, limit, offset):
+    # 其他資料庫沒有全文索引，只比對 search_terms
+    criteria = [MoodLog.search_terms.contains(term, autoescape=True) for term in terms]
+    return db.session.query(MoodLog.date, MoodLog.mood, MoodLog.diary, db.literal(0.0)) \
+        .filter(MoodLog.user_id == user_id, MoodLog.deleted_at.is_(None), *criteria) \
+        .order_by(MoodLog.date.desc()) \
+        .limit(limit).offset(offset).all()
+
+
+SEARCH_BACKENDS = {
+    'postgresql': _search_postgres,
+    'sqlite': _search_sqlite,
+}
+
+
+def search_diaries(user_id, query, limit=20, offset=0):
+    """回傳 (查詢詞, [(date, mood, diary, score), ...])，依相關程度排序；所有查詢詞都要出現"""
+    terms = query_terms(query)
+    if not terms:
+        return terms, []
+    search = SEARCH_BACKENDS.get(db.session.get_bind().dialect.name, _search_like)
+    return terms, search(int(user_id), terms, limit, offset)
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models import MoodLog
+from text_search import diary_terms
+
+LOG_VALUE_FIELDS = ('mood', 'diary')
+# 隨欄位一起更新的衍生欄位
+DERIVED_FIELDS = {'diary': ('search_terms',)}
+
+
+def _upsert_statement(insert, rows, fields):
+    """
+    一個 INSERT ... ON CONFLICT (user_id, date) DO UPDATE：
+    只覆寫這批有提供的欄位；已軟刪除的紀錄視為重新新增（未提供的欄位清空）；
+    內容與現有紀錄相同時不更新，重送同一批不會改變 updated_at。
+    """
+    stmt = insert(MoodLog).values(rows)
+    excluded = stmt.excluded
+    deleted = MoodLog.deleted_at.isnot(None)
+    set_ = {'updated_at': excluded.updated_at, 'deleted_at': None}
+    changed = [deleted]
+    for field in LOG_VALUE_FIELDS:
+        if field in fields:
+            changed.append(getattr(MoodLog, field).is_distinct_from(getattr(excluded, field)))
+        for name in (field, *DERIVED_FIELDS.get(field, ())):
+            if field in fields:
+                set_[name] = getattr(excluded, name)
+            else:
+                set_[name] = db.case((deleted, ''), else_=getattr(MoodLog, name))
+    return stmt.on_conflict_do_update(
+        index_elements=[MoodLog.user_id, MoodLog.date],
+        set_=set_,
+        where=db.or_(*changed)
+    )
+
+
+def _upsert_rows(user_id, entries):
+    """逐筆查詢再新增或更新，供不支援 ON CONFLICT 的資料庫使用"""
+    statuses = {}
+    for log_date, values in entries.items():
+        log = MoodLog.query.filter_by(user_id=user_id, date=log_date).first()
+        if log is None:
+            db.session.add(MoodLog(user_id=user_id, date=log_date, **{
+                field: values.get(field) or '' for field in LOG_VALUE_FIELDS
+            }))
+            statuses[log_date] = 'created'
+            continue
+        if log.deleted_at is not None:
+            log.deleted_at = None
+            for field in LOG_VALUE_FIELDS:
+                setattr(log, field, values.get(field) or '')
+            statuses[log_date] = 'updated'
+            continue
+        changed = False
+        for field, value in values.items():
+            if getattr(log, field) != value:
+                setattr(log, field, value)
+                changed = True
+        statuses[log_date] = 'updated' if changed else 'unchanged'
+    return statuses
+
+
+def upsert_logs(user_id, entries):
+    """
+    entries 為 {日期: {有提供的欄位: 值}}，回傳 {日期: created、updated 或 unchanged}。
+    依提供的欄位組合分組，每組一個語句（通常整批只有一組），由呼叫端 commit。
+    呼叫端須先以 rollups.lock_user_logs 鎖住使用者，updated_at 才會與 commit 順序一致。
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        insert = pg_insert
+    elif dialect == 'sqlite':
+        insert = sqlite_insert
+    else:
+        return _upsert_rows(user_id, entries)
+
+    now = datetime.utcnow()
+    groups = {}
+    for log_date, values in entries.items():
+        groups.setdefault(frozenset(values), []).append({
+            'user_id': user_id,
+            'date': log_date,
+            'updated_at': now,
+            'search_terms': diary_terms(values.get('diary')),
+            **{field: values.get(field) or '' for field in LOG_VALUE_FIELDS}
+        })
+
+    if dialect == 'sqlite':
+        # SQLite 無法從 RETURNING 分辨新增或更新，先查出已存在的日期（同一個交易內）
+        existing = {log_date for (log_date,) in db.session.query(MoodLog.date).filter(
+            MoodLog.user_id == user_id, MoodLog.date.in_(list(entries))
+        )}
+
+    statuses = dict.fromkeys(entries, 'unchanged')
+    for fields, rows in groups.items():
+        stmt = _upsert_statement(insert, rows, fields)
+        if dialect == 'postgresql':
+            # xmax 為 0 表示這一列是新插入的
+            stmt = stmt.returning(MoodLog.date, db.literal_column('xmax = 0').label('inserted'))
+            for log_date, inserted in db.session.execute(stmt):
+                statuses[log_date] = 'created' if inserted else 'updated'
+        else:
+            stmt = stmt.returning(MoodLog.date)
+            for (log_date,) in db.session.execute(stmt):
+                statuses[log_date] = 'updated' if log_date in existing else 'created'
+    return statuses
@@ -0,0 +1,248 @@
+"""
+心情統計的彙總表：mood_rollups（每週、每月各心情的紀錄數與日記數）與 mood_streaks（連續紀錄天數）。
+
+寫入紀錄時只重算受影響的那一週與那個月（update_rollups，與紀錄在同一個交易）；
+flask rollups backfill 以 NumPy 分批重建所有使用者的彙總，flask rollups check 比對彙總與原始紀錄。
+"""
+from datetime import date, timedelta
+
+import click
+import numpy as np
+from flask.cli import with_appcontext
+
+from extensions import db
+from models import User, MoodLog, MoodRollup, MoodStreak
+
+PERIODS = ('week', 'month')
+EPOCH = date(1970, 1, 1)
+
+
+def period_start(period, day):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_end(period, start):
+    """下一期的第一天"""
+    if period == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=31)).replace(day=1)
+
+
+def _log_rows(*criteria):
+    # 只讀日期、心情與是否寫了日記，不讀日記內容
+    return db.session.query(
+        MoodLog.user_id, MoodLog.date, MoodLog.mood, db.func.coalesce(MoodLog.diary, '') != ''
+    ).filter(MoodLog.deleted_at.is_(None), *criteria).all()
+
+
+def compute_rollups(rows):
+    """rows 為 (user_id, date, mood, 是否有日記)；回傳 MoodRollup 欄位 dict 的 list"""
+    if not rows:
+        return []
+    user_ids, dates, moods, has_diary = zip(*rows)
+    users = np.array(user_ids, dtype=np.int64)
+    days = np.array(dates, dtype='datetime64[D]')
+    diaries = np.array(has_diary, dtype=bool)
+    mood_names, mood_codes = np.unique(np.array([m or '' for m in moods], dtype=object), return_inverse=True)
+
+    day_numbers = days.astype(np.int64)  # 1970-01-01（星期四）為 0
+    starts = {
+        'week': day_numbers - (day_numbers + 3) % 7,
+        'month': days.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64),
+    }
+    rollups = []
+    for period, start in starts.items():
+        keys, inverse = np.unique(np.stack([users, start, mood_codes.ravel()]), axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+        entries = np.bincount(inverse, minlength=keys.shape[1])
+        diary_counts = np.bincount(inverse, weights=diaries, minlength=keys.shape[1])
+        for (user_id, start_day, mood), count, diary_count in zip(keys.T, entries, diary_counts):
+            rollups.append({
+                'user_id': int(user_id),
+                'period': period,
+                'period_start': EPOCH + timedelta(days=int(start_day)),
+                'mood': mood_names[mood],
+                'entries': int(count),
+                'diaries': int(diary_count)
+            })
+    return rollups
+
+
+def compute_streaks(rows):
+    """rows 為 (user_id, date)；回傳 {user_id: MoodStreak 欄位 dict}"""
+    if not rows:
+        return {}
+    users = np.array([row[0] for row in rows], dtype=np.int64)
+    days = np.array([row[1] for row in rows], dtype='datetime64[D]').astype(np.int64)
+    order = np.lexsort((days, users))
+    users, days = users[order], days[order]
+
+    # 換使用者或日期不連續時開始新的一段
+    run_starts = np.ones(len(days), dtype=bool)
+    run_starts[1:] = (users[1:] != users[:-1]) | (days[1:] - days[:-1] != 1)
+    run_index = np.flatnonzero(run_starts)
+    run_lengths = np.diff(np.append(run_index, len(days)))
+    run_users = users[run_index]
+    run_ends = days[np.append(run_index[1:], len(days)) - 1]
+
+    user_index = np.flatnonzero(np.append(True, run_users[1:] != run_users[:-1]))
+    longest = np.maximum.reduceat(run_lengths, user_index)
+    last_run = np.append(user_index[1:], len(run_users)) - 1
+    return {
+        int(run_users[i]): {
+            'user_id': int(run_users[i]),
+            'last_date': EPOCH + timedelta(days=int(run_ends[last])),
+            'current_length': int(run_lengths[last]),
+            'longest_length': int(longest_length)
+        }
+        for i, last, longest_length in zip(user_index, last_run, longest)
+    }
+
+
+def _rebuild_streak(user_id):
+    rows = db.session.query(MoodLog.user_id, MoodLog.date) \
+        .filter(MoodLog.user_id == user_id, MoodLog.deleted_at.is_(None)).all()
+    values = compute_streaks(rows).get(user_id)
+    streak = db.session.get(MoodStreak, user_id)
+    if values is None:
+        if streak is not None:
+            db.session.delete(streak)
+    elif streak is None:
+        db.session.add(MoodStreak(**values))
+    else:
+        for key, value in values.items():
+            setattr(streak, key, value)
+
+
+def lock_user_logs(user_id):
+    """
+    鎖住使用者直到交易結束，同一位使用者的紀錄與彙總依序寫入。
+    須在讀取或修改任何 MoodLog 之前呼叫：updated_at 在鎖住之後才產生，
+    commit 的順序才會與 updated_at 一致，增量同步的游標不會跳過較晚 commit 的變更。
+    """
+    db.session.query(User.id).filter(User.id == int(user_id)).with_for_update().one()
+
+
+def update_rollups(user_id, dates, days_changed=True):
+    """
+    重算 dates 所在的週與月的彙總，由呼叫端 commit。
+    days_changed 表示有新增、恢復或刪除某一天；只改心情或日記時連續天數不變。
+    """
+    user_id = int(user_id)
+    # 呼叫端通常已經鎖住；同一個交易再鎖一次不會等待
+    lock_user_logs(user_id)
+
+    buckets = {(period, period_start(period, day)) for day in dates for period in PERIODS}
+    low = min(start for _, start in buckets)
+    high = max(period_end(period, start) for period, start in buckets)
+    rows = _log_rows(MoodLog.user_id == user_id, MoodLog.date >= low, MoodLog.date < high)
+    rollups = [r for r in compute_rollups(rows) if (r['period'], r['period_start']) in buckets]
+
+    MoodRollup.query.filter(
+        MoodRollup.user_id == user_id,
+        db.tuple_(MoodRollup.period, MoodRollup.period_start).in_(list(buckets))
+    ).delete(synchronize_session=False)
+    if rollups:
+        db.session.execute(db.insert(MoodRollup), rollups)
+
+    if not days_changed:
+        return
+    streak = db.session.get(MoodStreak, user_id)
+    if streak is not None and len(dates) == 1 and dates[0] > streak.last_date:
+        # 在最後一天之後新增一天（最常見的情況）：不必重讀所有日期
+        day = dates[0]
+        streak.current_length = streak.current_length + 1 if day == streak.last_date + timedelta(days=1) else 1
+        streak.longest_length = max(streak.longest_length, streak.current_length)
+        streak.last_date = day
+    else:
+        _rebuild_streak(user_id)
+
+
+def expected_rollups(user_ids):
+    """依原始紀錄計算這些使用者應有的彙總與連續天數"""
+    rows = _log_rows(MoodLog.user_id.in_(user_ids))
+    return compute_rollups(rows), compute_streaks([row[:2] for row in rows])
+
+
+def rebuild_rollups(user_ids):
+    rollups, streaks = expected_rollups(user_ids)
+    MoodRollup.query.filter(MoodRollup.user_id.in_(user_ids)).delete(synchronize_session=False)
+    MoodStreak.query.filter(MoodStreak.user_id.in_(user_ids)).delete(synchronize_session=False)
+    if rollups:
+        db.session.execute(db.insert(MoodRollup), rollups)
+    if streaks:
+        db.session.execute(db.insert(MoodStreak), list(streaks.values()))
+    db.session.commit()
+
+
+def find_mismatches(user_ids):
+    """回傳彙總與原始紀錄不一致的使用者 id"""
+    rollups, streaks = expected_rollups(user_ids)
+    columns = ('user_id', 'period', 'period_start', 'mood', 'entries', 'diaries')
+    expected = {tuple(r[c] for c in columns) for r in rollups}
+    stored = set(db.session.query(*(getattr(MoodRollup, c) for c in columns))
+                 .filter(MoodRollup.user_id.in_(user_ids)))
+    mismatched = {row[0] for row in expected ^ stored}
+
+    stored_streaks = {s.user_id: s for s in MoodStreak.query.filter(MoodStreak.user_id.in_(user_ids))}
+    for user_id in set(streaks) | set(stored_streaks):
+        values, streak = streaks.get(user_id), stored_streaks.get(user_id)
+        if values is None or streak is None or any(getattr(streak, k) != v for k, v in values.items()):
+            mismatched.add(user_id)
+    return mismatched
+
+
+def _user_chunks(chunk_size, user_id=None):
+    if user_id is not None:
+        yield [user_id]
+        return
+    last_id = 0
+    while True:
+        chunk = [uid for (uid,) in db.session.query(User.id).filter(User.id > last_id)
+                 .order_by(User.id).limit(chunk_size)]
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]
+
+
+@click.group('rollups')
+def rollups_cli():
+    """重建或檢查心情統計的彙總表"""
+
+
+@rollups_cli.command('backfill')
+@click.option('--chunk-size', default=500, show_default=True, help='每批重建的使用者數')
+@click.option('--user-id', type=int, default=None, help='只重建這位使用者')
+@with_appcontext
+def backfill_command(chunk_size, user_id):
+    """依原始紀錄重建 mood_rollups 與 mood_streaks"""
+    users = 0
+    for chunk in _user_chunks(chunk_size, user_id):
+        rebuild_rollups(chunk)
+        users += len(chunk)
+        click.echo(f'已重建 {users} 位使用者')
+
+
+@rollups_cli.command('check')
+@click.option('--chunk-size', default=500, show_default=True, help='每批檢查的使用者數')
+@click.option('--user-id', type=int, default=None, help='只檢查這位使用者')
+@click.option('--fix', is_flag=True, help='重建不一致的使用者')
+@with_appcontext
+def check_command(chunk_size, user_id, fix):
+    """彙總與原始紀錄不一致時列出使用者並以非零狀態結束（--fix 則直接重建）"""
+    mismatched = []
+    for chunk in _user_chunks(chunk_size, user_id):
+        found = sorted(find_mismatches(chunk))
+        db.session.rollback()
+        if found and fix:
+            rebuild_rollups(found)
+        mismatched.extend(found)
+    if not mismatched:
+        click.echo('彙總與原始紀錄一致')
+    elif fix:
+        click.echo(f'已重建 {len(mismatched)} 位不一致的使用者：{mismatched[:20]}')
+    else:
+        raise click.ClickException(f'{len(mismatched)} 位使用者的彙總不一致：{mismatched[:20]}，可加上 --fix 重建')
@@ -1,9 +1,15 @@
-from flask import jsonify
+from flask import jsonify, Response
 from flask import request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from extensions import db
-from models import User, MoodLog, UserProfile
-from datetime import datetime
+from models import User, MoodLog, MoodRollup, MoodStreak, UserProfile
+from datetime import date, datetime, timedelta
+import hashlib
+from auth.tokens import issue_access_token
+from .log_upsert import LOG_VALUE_FIELDS, upsert_logs
+from .rollups import PERIODS, lock_user_logs, update_rollups
+from .diary_search import search_diaries
+from text_search import make_snippet
 from . import users_bp
 
 @users_bp.route('/check_is_filled', methods=['GET'])
@@ -26,8 +32,12 @@ def check_is_filled():
               type: boolean
               example: true
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    # is_filled 只會從 false 變成 true：claim 為 true 即可採信，
+    # 為 false 時可能是 set_is_filled 之前簽發的 token（或沒有 claims 的舊 token），查資料庫
+    if get_jwt().get('is_filled'):
+        return jsonify({'is_filled': True})
+
+    user = db.session.get(User, int(get_jwt_identity()))
     if not user:
         return jsonify({'msg': '找不到使用者'}), 400
 
@@ -52,15 +62,18 @@ def set_is_filled():
             msg:
               type: string
               example: 已設為填寫完成
+            token:
+              type: string
+              description: is_filled 為 true 的新 access token，取代目前的 token
     """
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user:
+    updated = User.query.filter_by(id=int(user_id)).update({'is_filled': True})
+    if not updated:
         return jsonify({'msg': '找不到使用者'}), 400
 
-    user.is_filled = True
     db.session.commit()
-    return jsonify({'msg': '已設為填寫完成'})
+    token = issue_access_token(user_id, get_jwt().get('is_verified', True), True)
+    return jsonify({'msg': '已設為填寫完成', 'token': token})
 
 @users_bp.route('/log', methods=['POST'])
 @jwt_required()
@@ -100,8 +113,15 @@ def add_or_update_log():
     mood = data.get('mood')
     diary = data.get('diary')
 
+    lock_user_logs(user_id)
     log = MoodLog.query.filter_by(user_id=user_id, date=log_date).first()
-    if log:
+    days_changed = log is None or log.deleted_at is not None
+    if log and log.deleted_at is not None:
+        # 已刪除：視為重新新增
+        log.deleted_at = None
+        log.mood = mood or ''
+        log.diary = diary or ''
+    elif log:
         # 已存在：更新
         if mood is not None:
             log.mood = mood
@@ -112,22 +132,178 @@ def add_or_update_log():
         log = MoodLog(user_id=user_id, date=log_date, mood=mood or '', diary=diary or '')
         db.session.add(log)
 
+    update_rollups(user_id, [log_date], days_changed)
     db.session.commit()
     return jsonify({'msg': '紀錄成功'}), 200
 
+LOG_BATCH_MAX = 366
+
+@users_bp.route('/log/batch', methods=['POST'])
+@jwt_required()
+def batch_upsert_logs():
+    """
+    一次新增或更新多天的心情與日記紀錄，供離線後同步使用 (需要 JWT)
+    ---
+    tags:
+      - Users
+    security:
+      - Bearer: []
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            logs:
+              type: array
+              description: 最多 366 筆；只更新有提供的欄位，同一天出現多次時以後面的為準
+              items:
+                type: object
+                properties:
+                  date:
+                    type: string
+                    example: "2025-05-07"
+                  mood:
+                    type: string
+                    example: "開心"
+                  diary:
+                    type: string
+                    example: "今天過得很好！"
+    responses:
+      200:
+        description: 依輸入順序回傳每筆的結果（created、updated、unchanged 或 error）
+        schema:
+          type: object
+          properties:
+            results:
+              type: array
+              items:
+                type: object
+                properties:
+                  date:
+                    type: string
+                    example: "2025-05-07"
+                  status:
+                    type: string
+                    example: created
+                  msg:
+                    type: string
+      400:
+        description: logs 不是陣列或超過上限
+    """
+    user_id = int(get_jwt_identity())
+    items = (request.get_json(silent=True) or {}).get('logs')
+    if not isinstance(items, list):
+        return jsonify({'msg': 'logs 需為陣列'}), 400
+    if len(items) > LOG_BATCH_MAX:
+        return jsonify({'msg': f'一次最多 {LOG_BATCH_MAX} 筆'}), 400
+
+    results = []
+    entries = {}
+    for item in items:
+        try:
+            log_date = datetime.strptime(item.get('date'), '%Y-%m-%d').date()
+        except (AttributeError, TypeError, ValueError):
+            date = item.get('date') if isinstance(item, dict) else None
+            results.append({'date': date, 'status': 'error', 'msg': '日期需為 YYYY-MM-DD'})
+            continue
+        values = {field: item[field] for field in LOG_VALUE_FIELDS if item.get(field) is not None}
+        if any(not isinstance(value, str) for value in values.values()) or len(values.get('mood', '')) > 50:
+            results.append({'date': item['date'], 'status': 'error', 'msg': 'mood 與 diary 需為字串，mood 最多 50 字'})
+            continue
+        entries.setdefault(log_date, {}).update(values)
+        results.append({'date': log_date})
+
+    if entries:
+        lock_user_logs(user_id)
+    statuses = upsert_logs(user_id, entries) if entries else {}
+    changed = [log_date for log_date, status in statuses.items() if status != 'unchanged']
+    if changed:
+        update_rollups(user_id, changed)
+    db.session.commit()
+    for result in results:
+        if 'status' not in result:
+            log_date = result['date']
+            result.update(date=log_date.isoformat(), status=statuses[log_date])
+    return jsonify({'results': results})
+
+LOG_FIELDS = ('date', 'mood', 'diary')
+LOG_PAGE_SIZE = 31
+LOG_PAGE_MAX = 366
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def _parse_sync_cursor(value):
+    """增量同步的游標為「updated_at,id」；空字串表示從頭開始"""
+    if not value:
+        return None
+    updated_at, log_id = value.rsplit(',', 1)
+    return datetime.fromisoformat(updated_at), int(log_id)
+
+def _logs_etag(user_id):
+    # 任何新增、修改或軟刪除都會更新 updated_at；只用索引算出最新時間與筆數，不讀取紀錄內容
+    latest, count = db.session.query(db.func.max(MoodLog.updated_at), db.func.count(MoodLog.id)) \
+        .filter(MoodLog.user_id == user_id).one()
+    key = f'{user_id}|{latest.isoformat() if latest else ""}|{count}|{request.query_string.decode()}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
 @users_bp.route('/log', methods=['GET'])
 @jwt_required()
 def get_all_logs():
     """
-    取得使用者所有心情與日記紀錄 (需要 JWT)
+    取得使用者的心情與日記紀錄，依日期由新到舊；帶 limit 或 cursor 時分頁，帶 since 時改為回傳該游標之後變更的紀錄 (需要 JWT)
+
+    分頁需由客戶端開啟：沒有 limit 與 cursor 時與先前相同，一次回傳所有紀錄（next_cursor 為 null），
+    舊客戶端不會因為不認得 next_cursor 而少拿到紀錄。
     ---
     tags:
       - Users
     security:
       - Bearer: []
+    parameters:
+      - name: from
+        in: query
+        type: string
+        required: false
+        description: 起始日期（含），例如 2025-05-01
+      - name: to
+        in: query
+        type: string
+        required: false
+        description: 結束日期（含），例如 2025-05-31
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: 每頁筆數（最多 366），帶入即開啟分頁；只帶 cursor 時為 31
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: 上一頁回傳的 next_cursor，帶入即開啟分頁
+      - name: fields
+        in: query
+        type: string
+        required: false
+        description: 以逗號分隔要回傳的欄位（date、mood、diary），例如 date,mood 不讀取日記內容
+      - name: since
+        in: query
+        type: string
+        required: false
+        description: 增量同步的游標（上次回應的 cursor）；空字串表示從頭同步。回傳依變更順序排列、包含已刪除的紀錄（deleted 為 true）
+      - name: If-None-Match
+        in: header
+        type: string
+        required: false
+        description: 上次回應的 ETag；紀錄沒有變更時回 304
     responses:
       200:
-        description: 回傳所有紀錄列表
+        description: >
+          回傳紀錄；未分頁時為所有紀錄，分頁時為一頁，next_cursor 為 null 表示沒有更多紀錄。
+          增量同步時另回傳 cursor（下次同步帶入 since）與 has_more
         schema:
           type: object
           properties:
@@ -145,18 +321,323 @@ def get_all_logs():
                   diary:
                     type: string
                     example: "今天過得很好！"
+            next_cursor:
+              type: string
+              example: "2025-04-07"
+            cursor:
+              type: string
+              example: "2025-05-07T10:31:02.118523,42"
+            has_more:
+              type: boolean
+      304:
+        description: 與 If-None-Match 相同，紀錄沒有變更
+      400:
+        description: 日期、limit、fields 或 since 格式錯誤
     """
     user_id = get_jwt_identity()
-    logs = MoodLog.query.filter_by(user_id=user_id).order_by(MoodLog.date.desc()).all()
+    args = request.args
+    try:
+        date_from = _parse_date(args.get('from'))
+        date_to = _parse_date(args.get('to'))
+        cursor = _parse_date(args.get('cursor'))
+        since = _parse_sync_cursor(args.get('since'))
+        limit = min(max(int(args.get('limit', LOG_PAGE_SIZE)), 1), LOG_PAGE_MAX)
+    except ValueError:
+        return jsonify({'msg': '日期需為 YYYY-MM-DD，limit 需為整數，since 需為上次回傳的 cursor'}), 400
+
+    fields = [f for f in args.get('fields', '').split(',') if f] or list(LOG_FIELDS)
+    if any(f not in LOG_FIELDS for f in fields):
+        return jsonify({'msg': f'fields 只能包含 {", ".join(LOG_FIELDS)}'}), 400
+    # 日期固定放在第一欄，分頁游標需要日期
+    fields = ['date'] + [f for f in dict.fromkeys(fields) if f != 'date']
+
+    etag = _logs_etag(user_id)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    query = db.session.query(*(getattr(MoodLog, f) for f in fields)).filter(MoodLog.user_id == user_id)
+    if date_from:
+        query = query.filter(MoodLog.date >= date_from)
+    if date_to:
+        query = query.filter(MoodLog.date <= date_to)
+
+    if 'since' in args:
+        # 依 (updated_at, id) 的順序讀取游標之後的變更，含已刪除的紀錄
+        query = query.add_columns(MoodLog.updated_at, MoodLog.id, MoodLog.deleted_at)
+        if since:
+            query = query.filter(db.tuple_(MoodLog.updated_at, MoodLog.id) > since)
+        rows = query.order_by(MoodLog.updated_at, MoodLog.id).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        result = []
+        next_since = args.get('since')
+        for row in rows:
+            *values, updated_at, log_id, deleted_at = row
+            next_since = f'{updated_at.isoformat()},{log_id}'
+            item = dict(zip(fields, values))
+            item['date'] = item['date'].isoformat()
+            if deleted_at is not None:
+                result.append({'date': item['date'], 'deleted': True})
+            else:
+                item['deleted'] = False
+                result.append(item)
+        response = jsonify({'logs': result, 'cursor': next_since, 'has_more': has_more})
+        response.set_etag(etag)
+        return response
+
+    # 只選取需要的欄位，沿著 uix_user_date (user_id, date) 索引往前讀
+    query = query.filter(MoodLog.deleted_at.is_(None)).order_by(MoodLog.date.desc())
+    if 'limit' not in args and 'cursor' not in args:
+        # 沒有要求分頁：與先前相同，回傳所有紀錄
+        rows = query.all()
+        has_more = False
+    else:
+        if cursor:
+            query = query.filter(MoodLog.date < cursor)
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
     result = [
+        {f: value.isoformat() if f == 'date' else value for f, value in zip(fields, row)}
+        for row in rows
+    ]
+    next_cursor = rows[-1][0].isoformat() if has_more else None
+    response = jsonify({'logs': result, 'next_cursor': next_cursor})
+    response.set_etag(etag)
+    return response
+
+STATS_BUCKETS = 12
+STATS_BUCKETS_MAX = 120
+
+@users_bp.route('/log/stats', methods=['GET'])
+@jwt_required()
+def get_log_stats():
+    """
+    心情統計：每週或每月的心情分布與寫日記的比例，以及連續紀錄天數 (需要 JWT)
+    ---
+    tags:
+      - Users
+    security:
+      - Bearer: []
+    parameters:
+      - name: period
+        in: query
+        type: string
+        enum: [week, month]
+        required: false
+        description: 統計區間，預設 week
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: 回傳最近幾個區間，預設 12，最多 120
+    responses:
+      200:
+        description: 回傳統計
+        schema:
+          type: object
+          properties:
+            period:
+              type: string
+              example: week
+            buckets:
+              type: array
+              items:
+                type: object
+                properties:
+                  start:
+                    type: string
+                    example: "2025-05-05"
+                  entries:
+                    type: integer
+                    example: 5
+                  diaries:
+                    type: integer
+                    example: 3
+                  diary_rate:
+                    type: number
+                    example: 0.6
+                  moods:
+                    type: object
+                    example: {"開心": 3, "難過": 2}
+            streak:
+              type: object
+              properties:
+                current:
+                  type: integer
+                  example: 4
+                longest:
+                  type: integer
+                  example: 12
+                last_date:
+                  type: string
+                  example: "2025-05-07"
+      400:
+        description: period 或 limit 格式錯誤
+    """
+    user_id = int(get_jwt_identity())
+    period = request.args.get('period', 'week')
+    if period not in PERIODS:
+        return jsonify({'msg': f'period 只能是 {", ".join(PERIODS)}'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', STATS_BUCKETS)), 1), STATS_BUCKETS_MAX)
+    except ValueError:
+        return jsonify({'msg': 'limit 需為整數'}), 400
+
+    # 只讀彙總表，不掃描原始紀錄
+    starts = db.session.query(MoodRollup.period_start).filter_by(user_id=user_id, period=period) \
+        .distinct().order_by(MoodRollup.period_start.desc()).limit(limit).all()
+    buckets = {}
+    if starts:
+        rows = MoodRollup.query.filter(
+            MoodRollup.user_id == user_id,
+            MoodRollup.period == period,
+            MoodRollup.period_start >= starts[-1][0]
+        ).all()
+        for row in rows:
+            bucket = buckets.setdefault(row.period_start, {'entries': 0, 'diaries': 0, 'moods': {}})
+            bucket['entries'] += row.entries
+            bucket['diaries'] += row.diaries
+            if row.mood:
+                bucket['moods'][row.mood] = row.entries
+    result = [
+        dict(bucket, start=start.isoformat(), diary_rate=round(bucket['diaries'] / bucket['entries'], 3))
+        for start, bucket in sorted(buckets.items(), reverse=True)
+    ]
+
+    streak = db.session.get(MoodStreak, user_id)
+    if streak is None:
+        streak_result = {'current': 0, 'longest': 0, 'last_date': None}
+    else:
+        # 最後一天是今天或昨天，連續紀錄才還沒中斷
+        active = streak.last_date >= date.today() - timedelta(days=1)
+        streak_result = {
+            'current': streak.current_length if active else 0,
+            'longest': streak.longest_length,
+            'last_date': streak.last_date.isoformat()
+        }
+    return jsonify({'period': period, 'buckets': result, 'streak': streak_result})
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX = 50
+
+@users_bp.route('/log/search', methods=['GET'])
+@jwt_required()
+def search_logs():
+    """
+    全文檢索自己的日記，依相關程度排序並分頁 (需要 JWT)
+    ---
+    tags:
+      - Users
+    security:
+      - Bearer: []
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: 查詢文字；中文以相鄰兩字比對，所有詞都要出現
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: 每頁筆數，預設 20，最多 50
+      - name: offset
+        in: query
+        type: integer
+        required: false
+        description: 略過前幾筆，使用上一頁回傳的 next_offset
+    responses:
+      200:
+        description: 回傳命中的紀錄；snippet 中命中的文字以 <mark> 標示，next_offset 為 null 表示沒有更多結果
+        schema:
+          type: object
+          properties:
+            results:
+              type: array
+              items:
+                type: object
+                properties:
+                  date:
+                    type: string
+                    example: "2025-05-07"
+                  mood:
+                    type: string
+                    example: "開心"
+                  snippet:
+                    type: string
+                    example: "今天和<mark>小貓</mark>去<mark>公園</mark>散步"
+                  score:
+                    type: number
+            next_offset:
+              type: integer
+              example: 20
+      400:
+        description: 缺少 q 或 limit、offset 格式錯誤
+    """
+    user_id = get_jwt_identity()
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'msg': '請輸入查詢文字'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_PAGE_MAX)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'msg': 'limit 與 offset 需為整數'}), 400
+
+    terms, rows = search_diaries(user_id, q, limit + 1, offset)
+    results = [
         {
-            'date': log.date.isoformat(),
-            'mood': log.mood,
-            'diary': log.diary
+            'date': log_date.isoformat(),
+            'mood': mood,
+            'snippet': make_snippet(diary, terms),
+            'score': round(float(score), 4)
         }
-        for log in logs
+        for log_date, mood, diary, score in rows[:limit]
     ]
-    return jsonify({'logs': result})
+    next_offset = offset + limit if len(rows) > limit else None
+    return jsonify({'results': results, 'next_offset': next_offset})
+
+@users_bp.route('/log/<log_date>', methods=['DELETE'])
+@jwt_required()
+def delete_log(log_date):
+    """
+    刪除某一天的紀錄；保留為軟刪除，讓其他裝置的增量同步能收到刪除 (需要 JWT)
+    ---
+    tags:
+      - Users
+    security:
+      - Bearer: []
+    parameters:
+      - name: log_date
+        in: path
+        type: string
+        required: true
+        description: 日期，例如 2025-05-07
+    responses:
+      200:
+        description: 已刪除
+      400:
+        description: 日期格式錯誤
+      404:
+        description: 找不到該日的紀錄
+    """
+    user_id = get_jwt_identity()
+    try:
+        log_date = _parse_date(log_date)
+    except ValueError:
+        return jsonify({'msg': '日期需為 YYYY-MM-DD'}), 400
+
+    lock_user_logs(user_id)
+    log = MoodLog.query.filter_by(user_id=user_id, date=log_date).filter(MoodLog.deleted_at.is_(None)).first()
+    if not log:
+        return jsonify({'msg': '找不到紀錄'}), 404
+    log.deleted_at = datetime.utcnow()
+    update_rollups(user_id, [log_date])
+    db.session.commit()
+    return jsonify({'msg': '已刪除'}), 200
 
 @users_bp.route('/profile', methods=['POST'])
 @jwt_required()